@@ -0,0 +1,139 @@
+import threading
+import time
+import numpy as np
+from distance_matrix import distance_matrix
+from functions import nearest_neighbor, ant_colony_optimization, total_distance
+from genetic import genetic_algorithm
+from local_search import improve_route
+from solver import check_algorithm, needs_matrix
+from space_filling import hilbert_tour, window_optimize
+from exact import solve_exact
+
+DEFAULT_TIME_BUDGET = 30.0  # Seconds for the whole solve
+CONSTRUCTION_SHARE = 0.5  # Part of the budget given to ACO / GA when local search follows
+MAX_ITERATIONS = 10 ** 9  # ACO and GA run until the budget is used up or they are stopped
+
+
+class AnytimeSolve:
+    """
+    Routes a single vehicle in a background thread, always holding the best route found so far.
+
+    A nearest neighbor route (Hilbert curve tour for "hilbert") is available almost
+    immediately; ACO or GA and then 2-opt / Or-opt local search (window_optimize for
+    "hilbert") improve on it until the time budget is used up or cancel() is called,
+    at which point the best route so far is the result. "exact" finishes with
+    solve_exact in the time that is left.
+
+    Parameters:
+    locations (array-like): An (n, 2) array of [latitude, longitude] coordinates; stop 0 is the depot.
+    algorithm (str, optional): One of solver.ALGORITHMS.
+    improve (bool, optional): Apply local search after construction.
+    time_budget (float, optional): Wall-clock seconds for the whole solve.
+    dist_matrix (numpy array, optional): Precomputed distance matrix; built when needed otherwise.
+    seed (int, optional): Seed for the randomized algorithms.
+    """
+
+    def __init__(self, locations, algorithm="aco", improve=True, time_budget=DEFAULT_TIME_BUDGET,
+                 dist_matrix=None, seed=None):
+        check_algorithm(algorithm, len(locations))
+        self.locations = np.asarray(locations, dtype=np.float64)
+        self.algorithm = algorithm
+        self.improve = improve
+        self.time_budget = time_budget
+        self.dist_matrix = dist_matrix
+        self.seed = seed
+        self.lock = threading.Lock()
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.start_time = None
+        self.route = None
+        self.distance = float("inf")
+        self.constructed_distance = None  # Best distance before local search
+        self.proven = False  # Whether solve_exact proved the best route optimal
+        self.history = []  # (seconds since start, distance) for every improvement
+        self.phase = "starting"
+        self.error = None
+
+    def start(self):
+        self.start_time = time.perf_counter()
+        self.thread.start()
+        return self
+
+    # Stop early; the best route found so far becomes the result
+    def cancel(self):
+        self.stop.set()
+
+    def done(self):
+        return self.start_time is not None and not self.thread.is_alive()
+
+    def wait(self, timeout=None):
+        self.thread.join(timeout)
+        return self.done()
+
+    def elapsed(self):
+        return 0.0 if self.start_time is None else time.perf_counter() - self.start_time
+
+    # Best (route, distance) so far, safe to call from any thread
+    def best(self):
+        with self.lock:
+            return (None if self.route is None else list(self.route)), self.distance
+
+    # Result in the format of solver.solve_locations: routes, distances, km saved by local search and
+    # whether the route is proven optimal
+    def solution(self):
+        route, distance = self.best()
+        saved_km = 0.0 if self.constructed_distance is None else max(self.constructed_distance - distance, 0.0)
+        return [route], [distance], saved_km, self.proven
+
+    def _offer(self, route, distance):
+        with self.lock:
+            if distance < self.distance - 1e-9:
+                self.route = list(route)
+                self.distance = float(distance)
+                self.history.append((self.elapsed(), self.distance))
+
+    def _remaining(self):
+        return max(self.time_budget - self.elapsed(), 0.0)
+
+    def _run(self):
+        try:
+            locations, dist = self.locations, self.dist_matrix
+            if dist is None and needs_matrix(self.algorithm, len(locations)):
+                self.phase = "matrix"
+                dist = distance_matrix(locations)
+            self.phase = "construction"
+            if self.algorithm == "hilbert":
+                route = hilbert_tour(locations)
+            else:
+                route, _ = nearest_neighbor(locations, dist)
+            self._offer(route, total_distance(route, locations, dist))
+
+            budget = self._remaining() * (CONSTRUCTION_SHARE if self.improve else 1.0)
+            if self.algorithm == "aco" and not self.stop.is_set():
+                ant_colony_optimization(dist, n_iterations=MAX_ITERATIONS, seed=self.seed, time_budget=budget,
+                                        callback=self._offer, stop=self.stop)
+            elif self.algorithm == "ga" and not self.stop.is_set():
+                genetic_algorithm(dist, num_generations=MAX_ITERATIONS, seed=self.seed, time_budget=budget,
+                                  callback=self._offer, stop=self.stop)
+            self.constructed_distance = self.distance
+
+            if self.improve and not self.stop.is_set():
+                self.phase = "improvement"
+                route, _ = self.best()
+                if self.algorithm == "hilbert":
+                    route, _ = window_optimize(route, locations, time_budget=self._remaining(),
+                                               callback=self._offer, stop=self.stop)
+                else:
+                    route, _ = improve_route(route, locations, dist, time_budget=self._remaining(),
+                                             callback=self._offer, stop=self.stop)
+                self._offer(route, total_distance(route, locations, dist))
+            if self.algorithm == "exact" and not self.stop.is_set():
+                self.phase = "exact"
+                route, _ = self.best()
+                route, distance, proven = solve_exact(dist, route, self._remaining())
+                self._offer(route, distance)
+                self.proven = proven
+            self.phase = "cancelled" if self.stop.is_set() else "done"
+        except Exception as e:
+            self.error = e
+            self.phase = "failed"
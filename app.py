@@ -4,11 +4,130 @@ import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 import time
-from functions import nearest_neighbor, total_distance, convert_distance, simulate_route
+import os
+from anytime import AnytimeSolve, DEFAULT_TIME_BUDGET as ANYTIME_TIME_BUDGET
+from functions import convert_distance, simulate_route
+from distance_matrix import distance_matrix
+from exact import route_bounds, optimality_gap
+from local_search import DEFAULT_TIME_BUDGET
+from manifest import read_manifest
+from profiling import Profiler, phase, profile
+from routing_service import RoutingClient
+from solver import solve_locations, needs_matrix, ALGORITHM_MAX_STOPS
+from solve_cache import SolveCache, fingerprint
+
+MATRIX_CACHE_SIZE = 8  # Distance matrices are large, so fewer of them are kept
+MAX_LOCATIONS = 200000  # Largest randomly generated location set
+PROGRESS_INTERVAL = 1.0  # Seconds between refreshes of a background solve's progress
+
+# Routing algorithm names shown in the sidebar, mapped to solver.ALGORITHMS
+ALGORITHM_NAMES = {
+    "Nearest Neighbor": "nearest_neighbor",
+    "Ant Colony Optimization": "aco",
+    "Genetic Algorithm": "ga",
+    "Space-Filling Curve (Hilbert)": "hilbert",
+    "Exact (Held-Karp / Branch and Bound)": "exact",
+}
 
 # Set page configuration
 st.set_page_config(page_title="Delivery Route Optimization", page_icon="🚚", layout="wide")
 
+
+# Solve results shared by every session on this server; set ROUTE_CACHE_DIR to keep them on disk too
+@st.cache_resource
+def get_solve_cache():
+    return SolveCache(directory=os.environ.get("ROUTE_CACHE_DIR"))
+
+
+@st.cache_resource
+def get_matrix_cache():
+    return SolveCache(maxsize=MATRIX_CACHE_SIZE)
+
+
+# Set ROUTING_SERVICE_URL to solve on a shared routing_service instead of in this process
+@st.cache_resource
+def get_routing_client():
+    url = os.environ.get("ROUTING_SERVICE_URL")
+    return RoutingClient(url) if url else None
+
+
+# Route the locations with the selected options, memoized on a fingerprint of both
+# (by the routing service, which shares solves and matrices across apps, when there is one)
+def solve(locations, algorithm, num_vehicles, improve, time_budget):
+    key = fingerprint(locations, algorithm=algorithm, num_vehicles=num_vehicles, improve=improve, time_budget=time_budget)
+    client = get_routing_client()
+    if client is not None:
+        return key, client.solve(locations, ALGORITHM_NAMES[algorithm], num_vehicles, improve, time_budget)[1]
+
+    def compute():
+        dist_matrix = None
+        if num_vehicles == 1 and needs_matrix(ALGORITHM_NAMES[algorithm], len(locations)):
+            with phase("matrix"):
+                dist_matrix = get_matrix_cache().get_or_compute(fingerprint(locations), lambda: distance_matrix(locations))
+        return solve_locations(locations, ALGORITHM_NAMES[algorithm], num_vehicles, improve, time_budget, dist_matrix)
+
+    return key, get_solve_cache().get_or_compute(key, compute)
+
+
+# Lower bounds and optimality gaps of a solution's routes, memoized with the solution
+def solution_bounds(key, locations, routes, route_distances):
+    return get_solve_cache().get_or_compute(f"{key}:bounds", lambda: route_bounds(routes, route_distances, locations))
+
+
+# Per-phase timings and counters of the given profilers, with a JSON export
+def show_performance(*profilers):
+    combined = Profiler()
+    for profiler in profilers:
+        if profiler is not None:
+            combined.merge(profiler)
+    with st.expander("Performance"):
+        st.dataframe(pd.DataFrame({
+            "Phase": list(combined.phases),
+            "Calls": [calls for calls, _ in combined.phases.values()],
+            "Time (ms)": [total / 1e6 for _, total in combined.phases.values()],
+        }))
+        if combined.counters:
+            st.dataframe(pd.DataFrame({"Counter": list(combined.counters), "Value": list(combined.counters.values())}))
+        st.download_button("Download as JSON", combined.to_json(indent=1), file_name="performance.json",
+                           mime="application/json")
+
+
+# Static map of a route, used for the progress of background solves
+def route_map(locations, route):
+    points = locations[route]
+    fig = go.Figure(go.Scattermapbox(lat=points[:, 0], lon=points[:, 1], mode="lines+markers",
+                                     marker=dict(size=6, color="black"), line=dict(width=2, color="blue")))
+    fig.update_layout(mapbox=dict(style="open-street-map", zoom=9,
+                                  center=dict(lat=float(points[:, 0].mean()), lon=float(points[:, 1].mean()))),
+                      margin=dict(t=0, b=0, l=0, r=0), height=500)
+    return fig
+
+
+# Best route so far of a background solve, refreshed on its own; once the solve has finished
+# (or was stopped) its route becomes the session's solution and the whole page is rerun
+@st.fragment(run_every=PROGRESS_INTERVAL)
+def show_progress(key, job, distance_unit):
+    if job.done():
+        del st.session_state.job
+        if job.error is not None:
+            st.session_state.solve_error = f"{type(job.error).__name__}: {job.error}"
+        else:
+            st.session_state.solution = (key, job.solution())
+            st.session_state.solve_profile = None
+        st.rerun()
+
+    route, distance = job.best()
+    col1, col2, col3 = st.columns(3)
+    unit = "km" if distance_unit == "Kilometers" else "mi"
+    col1.metric("Best Distance", f"{convert_distance(distance, distance_unit):.2f} {unit}" if route else "-")
+    col2.metric("Elapsed", f"{job.elapsed():.1f} s", f"of {job.time_budget:.0f} s budget", delta_color="off")
+    col3.metric("Improvements", len(job.history))
+    st.caption(f"Solver phase: {job.phase}")
+    if route is not None:
+        st.plotly_chart(route_map(job.locations, route))
+    if st.button("Stop and accept current route"):
+        job.cancel()
+
 # Custom CSS for styling
 st.markdown(
     """
@@ -150,7 +269,7 @@ else:
     st.sidebar.header("User Input Parameters")
 
     # Example input for delivery locations
-    num_locations = st.sidebar.number_input("Number of Delivery Locations", min_value=1, max_value=100, value=5)
+    num_locations = st.sidebar.number_input("Number of Delivery Locations", min_value=1, max_value=MAX_LOCATIONS, value=5)
 
 
     # Initialize session state attributes if they don't exist
@@ -172,6 +291,18 @@ else:
 
         st.success(f"{num_locations} locations generated within the London area!")
 
+    # Option to load the stops of a delivery manifest (CSV or Parquet with latitude/longitude columns)
+    manifest_file = st.sidebar.file_uploader("Or Upload a Delivery Manifest", type=["csv", "parquet"])
+    if manifest_file is not None and st.sidebar.button("Load Manifest"):
+        try:
+            manifest = read_manifest(manifest_file)
+        except (KeyError, ValueError) as e:
+            st.error(f"Could not read the manifest: {e}")
+        else:
+            st.session_state.locations = manifest.locations
+            st.success(f"{len(manifest.locations)} locations loaded from {manifest_file.name} "
+                       f"({manifest.invalid} invalid and {manifest.duplicates} duplicate rows skipped).")
+
     # Display the generated locations and plot
     if st.session_state.locations.size > 0:
         df = pd.DataFrame(st.session_state.locations, columns=["Latitude", "Longitude"])
@@ -200,43 +331,117 @@ else:
     # Sidebar slider for simulation speed
     simulation_speed = st.sidebar.slider("Adjust Simulation Speed", min_value=1, max_value=10, value=5)
 
+    # Fleet size; with more than one vehicle the stops are clustered and each cluster is routed separately
+    num_vehicles = st.sidebar.number_input("Number of Vehicles", min_value=1, max_value=60, value=1)
+
+    # Construction algorithm for the initial route (single vehicle), among those that can route this many stops
+    n_stops = len(st.session_state.locations)
+    algorithm = st.sidebar.selectbox("Routing Algorithm", tuple(
+        name for name, key in ALGORITHM_NAMES.items() if n_stops <= ALGORITHM_MAX_STOPS.get(key, n_stops)
+    ), disabled=num_vehicles > 1)
+
+    # Optional local search (2-opt / Or-opt) on top of the constructed route
+    improve = st.sidebar.checkbox("Improve route (2-opt / Or-opt)", value=True)
+    improve_time_budget = st.sidebar.slider("Improvement Time Budget (seconds)", min_value=0.5, max_value=30.0, value=DEFAULT_TIME_BUDGET, disabled=not improve)
+
+    # Anytime mode: the solver runs in the background for the whole budget, showing its best route so far
+    background = st.sidebar.checkbox("Solve in background and show progress", value=False, disabled=num_vehicles > 1) and num_vehicles == 1
+    background_time_budget = st.sidebar.slider("Total Solve Time Budget (seconds)", min_value=1.0, max_value=300.0, value=ANYTIME_TIME_BUDGET, disabled=not background)
+
+
+    time_budget = background_time_budget if background else improve_time_budget
+    solve_params = dict(algorithm=algorithm, num_vehicles=int(num_vehicles), improve=improve, time_budget=float(time_budget))
 
     if st.sidebar.button("Optimize and Simulate Route"):
         if st.session_state.locations.size > 0:
-            locations = st.session_state.locations
-            route, exec_time = nearest_neighbor(locations)  # Get the optimized route
-            
-            total_dist_km = total_distance(route, locations)
-
-            # Convert distance based on user selection (Kilometers or Miles)
-            total_dist = convert_distance(total_dist_km, distance_unit)
-
-            # Calculate ETA (time = distance / speed)
-            eta_hours = total_dist / average_speed
-            eta_minutes = eta_hours * 60
-            
-            st.write("Simulating the delivery route...")
-            simulate_route(route, locations, speed=simulation_speed)  
-            # Prepare the essay-style text output for distance and travel time
-            distance_unit_label = 'kilometers' if distance_unit == 'Kilometers' else 'miles'
-            essay_text = f"The total distance to be covered on this delivery route is approximately {total_dist:.2f} {distance_unit_label}. " \
-                        f"With an average speed of {average_speed:.2f} {distance_unit_label} per hour, " \
-                        f"it is estimated that the entire journey will take around {eta_minutes:.0f} minutes, " \
-                        f"which is approximately {eta_hours:.2f} hours. " \
-                        f"The route has been optimized to minimize the total distance and maximize efficiency, " \
-                        f"ensuring that all delivery points are visited in a timely manner."
-
-            # Add a note about traffic conditions and constraints
-            note = "\n\n**Note:** This estimation assumes ideal driving conditions and does not account for real-world variables " \
-                "such as traffic delays, road closures, or other potential constraints that may affect the delivery time."
-
-            # Combine the essay text and note
-            full_text = essay_text + note
-
-            # Display the text in Streamlit
-            st.write(full_text)
-            
+            if "job" in st.session_state:
+                st.session_state.job[1].cancel()
+                del st.session_state.job
+            if background:
+                job = AnytimeSolve(st.session_state.locations, ALGORITHM_NAMES[algorithm], improve, solve_params["time_budget"])
+                st.session_state.job = (fingerprint(st.session_state.locations, **solve_params), job.start())
+                st.session_state.pop("solution", None)
+            else:
+                with profile() as profiler, phase("solve"):
+                    st.session_state.solution = solve(st.session_state.locations, **solve_params)
+                st.session_state.solve_profile = profiler
         else:
             st.warning("Please generate locations first.")
 
+    if "solve_error" in st.session_state:
+        st.error(f"The background solve failed: {st.session_state.pop('solve_error')}")
+    if "job" in st.session_state:
+        show_progress(*st.session_state.job, distance_unit)
+
+    # Show the last solution while the locations and solver options still match it, so changing
+    # the unit, speed or simulation speed only re-renders instead of solving again
+    solution = st.session_state.get("solution")
+    if solution and st.session_state.locations.size > 0 and solution[0] == fingerprint(st.session_state.locations, **solve_params):
+        locations = st.session_state.locations
+        routes, route_distances, saved_km, proven = solution[1]
+        
+        total_dist_km = sum(route_distances)
+
+        # Convert distance based on user selection (Kilometers or Miles)
+        total_dist = convert_distance(total_dist_km, distance_unit)
+
+        # Calculate ETA (time = distance / speed); vehicles drive in parallel, so the longest route sets it
+        eta_hours = convert_distance(max(route_distances), distance_unit) / average_speed
+        eta_minutes = eta_hours * 60
+        
+        st.write("Simulating the delivery route...")
+        with profile() as render_profile:
+            if len(routes) == 1:
+                simulate_route(routes[0], locations, speed=simulation_speed)
+            else:
+                st.dataframe(pd.DataFrame({
+                    "Vehicle": range(1, len(routes) + 1),
+                    "Stops": [len(r) - 2 for r in routes],
+                    f"Distance ({distance_unit})": [convert_distance(d, distance_unit) for d in route_distances],
+                }))
+                for vehicle, tab in enumerate(st.tabs([f"Vehicle {i + 1}" for i in range(len(routes))])):
+                    with tab:
+                        simulate_route(routes[vehicle], locations, speed=simulation_speed)
+        # Prepare the essay-style text output for distance and travel time
+        distance_unit_label = 'kilometers' if distance_unit == 'Kilometers' else 'miles'
+        essay_text = f"The total distance to be covered on this delivery route is approximately {total_dist:.2f} {distance_unit_label}. " \
+                    f"With an average speed of {average_speed:.2f} {distance_unit_label} per hour, " \
+                    f"it is estimated that the entire journey will take around {eta_minutes:.0f} minutes, " \
+                    f"which is approximately {eta_hours:.2f} hours. " \
+                    f"The route has been optimized to minimize the total distance and maximize efficiency, " \
+                    f"ensuring that all delivery points are visited in a timely manner."
+
+        if len(routes) > 1:
+            essay_text += f" The stops are shared between {len(routes)} vehicles, and the estimate is for the longest of their routes."
+        elif ALGORITHM_NAMES[algorithm] == "exact" and proven:
+            essay_text += " The route was computed by an exact solver rather than a heuristic, and is proven optimal."
+        elif ALGORITHM_NAMES[algorithm] == "exact":
+            essay_text += " The exact solver ran out of time, so this is the best route found, not proven optimal."
+        elif improve:
+            essay_text += f" Local search shortened the {algorithm.lower()} route by {convert_distance(saved_km, distance_unit):.2f} {distance_unit_label}."
+
+        # How far from the shortest possible route this can be (not available for very large routes)
+        bounds, gaps = solution_bounds(solution[0], locations, routes, route_distances)
+        if all(bound is not None for bound in bounds):
+            gap = optimality_gap(total_dist_km, sum(bounds))
+            assignment = " for this assignment of stops to vehicles" if len(routes) > 1 else ""
+            if gap is not None and gap < 1e-6:
+                essay_text += f" No shorter route exists{assignment}."
+            elif gap is not None:
+                essay_text += f" No route{assignment} can be shorter than {convert_distance(sum(bounds), distance_unit):.2f} " \
+                              f"{distance_unit_label}, so this one is at most {gap:.1%} longer than the optimum."
+
+        # Add a note about traffic conditions and constraints
+        note = "\n\n**Note:** This estimation assumes ideal driving conditions and does not account for real-world variables " \
+            "such as traffic delays, road closures, or other potential constraints that may affect the delivery time."
+
+        # Combine the essay text and note
+        full_text = essay_text + note
+
+        # Display the text in Streamlit
+        st.write(full_text)
+
+        # Where the time went: the last solve, plus rendering on this run
+        show_performance(st.session_state.get("solve_profile"), render_profile)
+
 
@@ -0,0 +1,125 @@
+"""
+Headless batch solver: routes many delivery manifests in one process and writes
+routes and metrics, without importing Streamlit or any plotting library.
+
+Example:
+    python batch_solve.py manifests/*.csv --output-dir routes/ --workers 8 --vehicles 3
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from exact import route_bounds, optimality_gap
+from local_search import DEFAULT_TIME_BUDGET
+from manifest import LAT_COLUMN, LON_COLUMN, read_manifest
+from profiling import profile
+from solver import ALGORITHMS, solve_locations
+from warm_start import WarmStart
+
+
+# Read the stop coordinates of one manifest (CSV or Parquet) into an (n, 2) float64 array,
+# streamed in chunks with invalid and repeated coordinates dropped
+def read_stops(path, lat_column=LAT_COLUMN, lon_column=LON_COLUMN):
+    return read_manifest(path, lat_column, lon_column).locations
+
+
+# Write one row per visited stop: vehicle, sequence number, stop index and coordinates
+def write_routes(path, routes, locations):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["vehicle", "sequence", "stop", LAT_COLUMN, LON_COLUMN])
+        for vehicle, route in enumerate(routes):
+            for sequence, stop in enumerate(route):
+                writer.writerow([vehicle, sequence, stop, locations[stop][0], locations[stop][1]])
+
+
+# Solve one manifest and write its routes; runs in a pool worker and returns its metrics
+def solve_manifest(path, output_dir, options):
+    name = os.path.splitext(os.path.basename(path))[0]
+    with profile() if options["profile"] else nullcontext() as profiler:
+        start_time = time.perf_counter()
+        locations = read_stops(path, options["lat_column"], options["lon_column"])
+        read_time = time.perf_counter() - start_time
+        # State of the previous solve of a manifest with the same file name, for recurring routes
+        warm_start = None
+        if options["warm_start_dir"] and options["vehicles"] == 1:
+            warm_start = WarmStart(os.path.join(options["warm_start_dir"], f"{name}.npz"), locations)
+        routes, route_distances, saved_km, proven = solve_locations(
+            locations, options["algorithm"], options["vehicles"], options["improve"],
+            options["time_budget"], seed=options["seed"], workers=1, warm_start=warm_start)
+    write_routes(os.path.join(output_dir, f"{name}.route.csv"), routes, locations)
+    metrics = {
+        "manifest": path,
+        "stops": len(locations),
+        "vehicles": sum(1 for route in routes if len(route) > 2),
+        "distance_km": float(sum(route_distances)),
+        "saved_km": float(saved_km),
+        "proven_optimal": bool(proven),
+        "read_seconds": read_time,
+        "solve_seconds": time.perf_counter() - start_time - read_time,
+    }
+    # Timed on its own: above MATRIX_MAX_STOPS stops per route no bound is computed, below it may rebuild the matrix
+    bound_start = time.perf_counter()
+    bounds = route_bounds(routes, route_distances, locations)[0]
+    bound = sum(bounds) if all(b is not None for b in bounds) else None
+    metrics["lower_bound_km"] = bound
+    metrics["gap"] = optimality_gap(sum(route_distances), bound)
+    metrics["bound_seconds"] = time.perf_counter() - bound_start
+    if warm_start is not None:
+        metrics["warm_start_overlap"] = warm_start.overlap if warm_start.usable() else 0
+    if profiler is not None:
+        metrics["profile"] = profiler.to_dict()
+    return metrics
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("manifests", nargs="+", help="CSV or Parquet files with one stop per row; the first row is the depot")
+    parser.add_argument("--output-dir", default="routes", help="Where route files and metrics.jsonl are written")
+    parser.add_argument("--algorithm", choices=ALGORITHMS, default="nearest_neighbor")
+    parser.add_argument("--vehicles", type=int, default=1)
+    parser.add_argument("--no-improve", dest="improve", action="store_false", help="Skip 2-opt / Or-opt local search")
+    parser.add_argument("--time-budget", type=float, default=DEFAULT_TIME_BUDGET, help="Local search seconds per manifest")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: one per CPU)")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--profile", action="store_true", help="Add per-phase timings and solver counters to the metrics")
+    parser.add_argument("--warm-start-dir", default=None,
+                        help="Seed each single-vehicle solve from the previous solve of a manifest with the same name "
+                             "and save its state here")
+    parser.add_argument("--lat-column", default=LAT_COLUMN)
+    parser.add_argument("--lon-column", default=LON_COLUMN)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.makedirs(args.output_dir, exist_ok=True)
+    options = {key: getattr(args, key) for key in
+               ("algorithm", "vehicles", "improve", "time_budget", "seed", "lat_column", "lon_column", "profile",
+                "warm_start_dir")}
+
+    start_time = time.perf_counter()
+    failures = 0
+    with ProcessPoolExecutor(args.workers) as executor, \
+            open(os.path.join(args.output_dir, "metrics.jsonl"), "w") as metrics:
+        futures = {executor.submit(solve_manifest, path, args.output_dir, options): path for path in args.manifests}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                failures += 1
+                result = {"manifest": futures[future], "error": f"{type(e).__name__}: {e}"}
+            metrics.write(json.dumps(result) + "\n")
+
+    elapsed = time.perf_counter() - start_time
+    print(f"Solved {len(args.manifests) - failures}/{len(args.manifests)} manifests in {elapsed:.1f} seconds",
+          file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,250 @@
+"""
+Seeded solver benchmark on the notebook's synthetic region scenarios (distinct towns,
+sparse and congested), writing wall time, peak memory, tour length and a lower bound
+on the optimal length per run as JSON.
+
+Example:
+    python benchmark.py --sizes 10 100 1000 10000 50000 --output bench.json
+    python benchmark.py --output new.json --compare bench.json
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from distance_matrix import distance_matrix
+from exact import solve_exact, lower_bound, optimality_gap, EXACT_MAX_STOPS
+from functions import nearest_neighbor, ant_colony_optimization, total_distance, MATRIX_MAX_STOPS
+from genetic import genetic_algorithm
+from local_search import improve_route
+from space_filling import hilbert_tour, window_optimize
+
+try:
+    import resource
+except ImportError:  # Not available on Windows; peak memory is then not reported
+    resource = None
+
+# Region layouts from the notebook's generate_synthetic_data examples
+SCENARIOS = {
+    "distinct_towns": [
+        {"lat_range": (-10, -5), "lon_range": (-10, -5)},
+        {"lat_range": (-5, 0), "lon_range": (-5, 0)},
+        {"lat_range": (0, 5), "lon_range": (0, 5)},
+    ],
+    "sparse": [{"lat_range": (-10, 10), "lon_range": (-10, 10)}],
+    "congested": [{"lat_range": (-2, 2), "lon_range": (-2, 2)}],
+}
+NOISE = 0.5  # Degrees of uniform noise added to every coordinate, as in the notebook
+
+DEFAULT_SIZES = (10, 100, 1000, 10000, 50000)
+DEFAULT_TIME_BUDGET = 10.0  # Seconds per solver run
+REGRESSION_TOLERANCE = 0.10  # Relative slowdown or length increase reported by --compare
+TIMING_NOISE = 0.05  # Seconds; smaller slowdowns are not reported as regressions
+
+
+# Stops spread evenly over the scenario's regions, each uniform in its box plus noise
+def generate_scenario(scenario, n_stops, seed):
+    regions = SCENARIOS[scenario]
+    rng = np.random.default_rng([seed, n_stops, list(SCENARIOS).index(scenario)])
+    blocks = []
+    for region, count in zip(regions, np.array_split(np.arange(n_stops), len(regions))):
+        low = [region["lat_range"][0], region["lon_range"][0]]
+        high = [region["lat_range"][1], region["lon_range"][1]]
+        blocks.append(rng.uniform(low, high, (len(count), 2)) + rng.uniform(-NOISE, NOISE, (len(count), 2)))
+    return np.concatenate(blocks)
+
+
+def _nearest_neighbor(locations, dist_matrix, time_budget, seed):
+    return nearest_neighbor(locations, dist_matrix)[0]
+
+
+def _nearest_neighbor_improved(locations, dist_matrix, time_budget, seed):
+    route, _ = nearest_neighbor(locations, dist_matrix)
+    return improve_route(route, locations, dist_matrix, time_budget=time_budget)[0]
+
+
+def _aco(locations, dist_matrix, time_budget, seed):
+    return ant_colony_optimization(dist_matrix, seed=seed, time_budget=time_budget)[0]
+
+
+def _ga(locations, dist_matrix, time_budget, seed):
+    return genetic_algorithm(dist_matrix, seed=seed, time_budget=time_budget)[0]
+
+
+def _hilbert(locations, dist_matrix, time_budget, seed):
+    return hilbert_tour(locations)
+
+
+# Windows are improved in-process so timings are comparable with the single-core solvers
+def _hilbert_windows(locations, dist_matrix, time_budget, seed):
+    return window_optimize(hilbert_tour(locations), locations, time_budget=time_budget, workers=1)[0]
+
+
+def _exact(locations, dist_matrix, time_budget, seed):
+    return solve_exact(dist_matrix, time_budget=time_budget)[0]
+
+
+# Benchmarked solvers: run(locations, dist_matrix, time_budget, seed) -> closed route, whether
+# it needs the full distance matrix, and the largest instance it is run on
+SOLVERS = {
+    "nearest_neighbor": {"run": _nearest_neighbor, "matrix": False, "max_stops": None},
+    "nearest_neighbor+ls": {"run": _nearest_neighbor_improved, "matrix": False, "max_stops": None},
+    "aco": {"run": _aco, "matrix": True, "max_stops": 2000},
+    "ga": {"run": _ga, "matrix": True, "max_stops": MATRIX_MAX_STOPS},
+    "hilbert": {"run": _hilbert, "matrix": False, "max_stops": None},
+    "hilbert+windows": {"run": _hilbert_windows, "matrix": False, "max_stops": None},
+    "exact": {"run": _exact, "matrix": True, "max_stops": EXACT_MAX_STOPS},
+}
+
+
+# Resident set high-water mark of this process in MB (ru_maxrss is in KB on Linux, bytes on macOS)
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+
+# One benchmark run; executed in a fresh worker process so the memory high-water mark is its own
+def run_case(scenario, n_stops, solver, time_budget, seed):
+    record = {"scenario": scenario, "stops": n_stops, "solver": solver, "seed": seed, "time_budget": time_budget}
+    spec = SOLVERS[solver]
+    if spec["max_stops"] is not None and n_stops > spec["max_stops"]:
+        record["skipped"] = f"more than {spec['max_stops']} stops"
+        return record
+
+    locations = generate_scenario(scenario, n_stops, seed)
+    baseline_mb = peak_rss_mb()
+    start_time = time.perf_counter()
+    dist_matrix = None
+    if spec["matrix"] or n_stops <= MATRIX_MAX_STOPS:
+        dist_matrix = distance_matrix(locations)
+    matrix_time = time.perf_counter() - start_time
+    route = spec["run"](locations, dist_matrix, time_budget, seed)
+    wall_time = time.perf_counter() - start_time
+    peak_mb = None if baseline_mb is None else max(peak_rss_mb() - baseline_mb, 0.0)  # Before scoring allocates
+
+    if sorted(route[:-1]) != list(range(n_stops)) or route[0] != route[-1]:
+        record["error"] = "route does not visit every stop exactly once"
+        return record
+    length = total_distance(route, locations, dist_matrix)
+    bound = lower_bound(locations, dist_matrix, length)  # None without a matrix
+    record.update({
+        "length_km": length,
+        "lower_bound_km": bound,
+        "bound_gap": optimality_gap(length, bound),
+        "matrix_seconds": matrix_time,
+        "solve_seconds": wall_time - matrix_time,
+        "wall_seconds": wall_time,
+        "peak_memory_mb": peak_mb,
+    })
+    return record
+
+
+def case_key(record):
+    return record["scenario"], record["stops"], record["seed"]
+
+
+# Fill in the best known length per instance (this run and, if given, a previous one) and each run's gap to it
+def add_gaps(results, previous=()):
+    best = {}
+    for record in list(results) + list(previous):
+        if "length_km" in record:
+            key = case_key(record)
+            best[key] = min(best.get(key, float("inf")), record["length_km"])
+    for record in results:
+        if "length_km" in record:
+            record["best_known_km"] = best[case_key(record)]
+            record["gap"] = record["length_km"] / max(record["best_known_km"], 1e-12) - 1
+    return results
+
+
+# Runs that got slower or longer than in a previous results file by more than `tolerance`
+def regressions(results, previous, tolerance=REGRESSION_TOLERANCE):
+    before = {case_key(r) + (r["solver"],): r for r in previous if "length_km" in r}
+    found = []
+    for record in results:
+        old = before.get(case_key(record) + (record["solver"],))
+        if old is None or "length_km" not in record:
+            continue
+        for metric in ("wall_seconds", "length_km"):
+            if metric == "wall_seconds" and record[metric] - old[metric] < TIMING_NOISE:
+                continue
+            ratio = record[metric] / max(old[metric], 1e-12)
+            if ratio > 1 + tolerance:
+                found.append({"scenario": record["scenario"], "stops": record["stops"], "solver": record["solver"],
+                              "metric": metric, "before": old[metric], "after": record[metric], "ratio": ratio})
+    return found
+
+
+def run_benchmark(scenarios=tuple(SCENARIOS), sizes=DEFAULT_SIZES, solvers=tuple(SOLVERS),
+                  time_budget=DEFAULT_TIME_BUDGET, seed=0, workers=1):
+    """
+    Runs every solver on every scenario and size.
+
+    Each run gets its own worker process (workers=1, the default, runs them
+    one after another so timings do not compete for cores).
+
+    Returns:
+    list: One record per run with the timings, peak memory, tour length, best known
+    length and gap, or a "skipped"/"error" entry.
+    """
+    cases = [(scenario, n, solver) for scenario in scenarios for n in sizes for solver in solvers]
+    with ProcessPoolExecutor(workers, max_tasks_per_child=1) as executor:
+        futures = [executor.submit(run_case, scenario, n, solver, time_budget, seed) for scenario, n, solver in cases]
+        results = []
+        for (scenario, n, solver), future in zip(cases, futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append({"scenario": scenario, "stops": n, "solver": solver, "seed": seed,
+                                 "error": f"{type(e).__name__}: {e}"})
+    return add_gaps(results)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scenarios", nargs="+", choices=tuple(SCENARIOS), default=tuple(SCENARIOS))
+    parser.add_argument("--sizes", nargs="+", type=int, default=DEFAULT_SIZES)
+    parser.add_argument("--solvers", nargs="+", choices=tuple(SOLVERS), default=tuple(SOLVERS))
+    parser.add_argument("--time-budget", type=float, default=DEFAULT_TIME_BUDGET, help="Seconds per solver run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=1, help="Runs executed at the same time")
+    parser.add_argument("--output", default="bench.json")
+    parser.add_argument("--compare", help="Previous results file; regressions against it are reported")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run_benchmark(args.scenarios, args.sizes, args.solvers, args.time_budget, args.seed, args.workers)
+    previous = []
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)["results"]
+        add_gaps(results, previous)
+
+    meta = {"python": platform.python_version(), "numpy": np.__version__, "platform": platform.platform(),
+            "time_budget": args.time_budget, "seed": args.seed}
+    with open(args.output, "w") as f:
+        json.dump({"meta": meta, "results": results}, f, indent=1)
+
+    for r in results:
+        if "length_km" in r:
+            print(f"{r['scenario']:>15} {r['stops']:>6} {r['solver']:>20} {r['wall_seconds']:9.3f}s "
+                  f"{r['length_km']:12.1f} km  gap {r['gap']:6.1%}", file=sys.stderr)
+        else:
+            print(f"{r['scenario']:>15} {r['stops']:>6} {r['solver']:>20} {r.get('skipped') or r.get('error')}",
+                  file=sys.stderr)
+    found = regressions(results, previous, args.tolerance)
+    for r in found:
+        print(f"Regression: {r['scenario']} {r['stops']} {r['solver']} {r['metric']} "
+              f"{r['before']:.3f} -> {r['after']:.3f} ({r['ratio']:.2f}x)", file=sys.stderr)
+    return 1 if found else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
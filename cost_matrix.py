@@ -0,0 +1,61 @@
+import numpy as np
+from distance_matrix import DEFAULT_BLOCK_ROWS
+
+# Storage types accepted for cost (distance or travel time) matrices
+COST_DTYPES = (np.int16, np.float32, np.float64)
+
+
+# Check that a cost matrix is square and stored in a supported type, without copying it.
+# Pass dtype to convert (e.g. float64 travel times in minutes to int16, half the size of float32).
+def as_cost_matrix(matrix, dtype=None):
+    if dtype is not None and np.dtype(dtype) == np.int16:
+        matrix = compact_cost_matrix(matrix)
+    elif dtype is not None:
+        matrix = np.asarray(matrix, dtype=dtype)
+    else:
+        matrix = np.asanyarray(matrix)
+    if matrix.ndim != 2 or matrix.shape[0] != matrix.shape[1]:
+        raise ValueError(f"Cost matrix must be square, got shape {matrix.shape}")
+    if matrix.dtype not in COST_DTYPES:
+        raise ValueError(f"Cost matrix dtype must be one of int16, float32, float64, got {matrix.dtype}")
+    return matrix
+
+
+# Round a cost matrix to int16, refusing values that do not fit instead of wrapping around
+def compact_cost_matrix(matrix):
+    matrix = np.asarray(matrix)
+    info = np.iinfo(np.int16)
+    if matrix.size and (matrix.min() < info.min or matrix.max() > info.max):
+        raise ValueError("Cost matrix values do not fit in int16; rescale them or use float32")
+    return np.rint(matrix).astype(np.int16)
+
+
+def save_cost_matrix(path, matrix, dtype=None):
+    np.save(path, as_cost_matrix(matrix, dtype))
+
+
+# Load a cost matrix saved with save_cost_matrix. With mmap=True the file is memory-mapped
+# read-only, so nothing is copied and worker processes opening the same file share the pages.
+def load_cost_matrix(path, mmap=True):
+    return as_cost_matrix(np.load(path, mmap_mode="r" if mmap else None))
+
+
+# Whether matrix[i, j] == matrix[j, i] everywhere, compared one block of rows at a time
+def is_symmetric(matrix, block_rows=DEFAULT_BLOCK_ROWS):
+    for start in range(0, len(matrix), block_rows):
+        stop = min(start + block_rows, len(matrix))
+        if not np.array_equal(matrix[start:stop], matrix[:, start:stop].T):
+            return False
+    return True
+
+
+# Something cheap to send to a worker process: the file path of a memory-mapped
+# matrix (reopened with load_cost_matrix), or the array itself otherwise
+def matrix_source(matrix):
+    if isinstance(matrix, np.memmap) and matrix.filename:
+        return str(matrix.filename)
+    return matrix
+
+
+def open_matrix_source(source):
+    return load_cost_matrix(source) if isinstance(source, str) else source
@@ -0,0 +1,73 @@
+import numpy as np
+from profiling import count
+from spatial_index import k_nearest_neighbors
+
+R = 6371  # Radius of the earth in km
+
+# Rows are filled this many at a time so the float64 trig temporaries stay
+# small even when the output matrix is large (or stored as float32)
+DEFAULT_BLOCK_ROWS = 1024
+
+
+# Vectorized haversine between paired arrays of coordinates (element-wise)
+def haversine_pairs(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(x, dtype=np.float64)) for x in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return R * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))  # Distance in km
+
+
+# Great-circle distances from every point in `sources` to every point in `targets`
+def haversine_block(sources, targets):
+    src = np.radians(np.asarray(sources, dtype=np.float64).reshape(-1, 2))
+    dst = np.radians(np.asarray(targets, dtype=np.float64).reshape(-1, 2))
+    lat1, lon1 = src[:, 0, None], src[:, 1, None]
+    lat2, lon2 = dst[None, :, 0], dst[None, :, 1]
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return R * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def distance_matrix(locations, dtype=np.float64, rows=None, block_rows=DEFAULT_BLOCK_ROWS, out=None):
+    """
+    Builds the great-circle distance matrix (in km) for a set of locations.
+
+    Parameters:
+    locations (array-like): An (n, 2) array of [latitude, longitude] coordinates.
+    dtype (numpy dtype, optional): np.float64 (default) or np.float32 for half the memory.
+    rows (array-like, optional): Only build these rows, giving a len(rows) x n block.
+    block_rows (int, optional): Number of rows computed per broadcast pass.
+    out (numpy array, optional): Array of the right shape to fill instead of allocating one (dtype is then ignored).
+
+    Returns:
+    numpy array: The distance matrix, with matrix[i, j] the distance from i to j.
+    """
+    locations = np.asarray(locations, dtype=np.float64).reshape(-1, 2)
+    row_ids = np.arange(len(locations)) if rows is None else np.asarray(rows, dtype=np.intp).reshape(-1)
+    matrix = np.empty((len(row_ids), len(locations)), dtype=dtype) if out is None else out
+    for start in range(0, len(row_ids), block_rows):
+        block = row_ids[start:start + block_rows]
+        matrix[start:start + len(block)] = haversine_block(locations[block], locations)
+    if rows is None:
+        np.fill_diagonal(matrix, 0)
+    count("haversine_evaluations", matrix.size)
+    return matrix
+
+
+# The k closest other locations for every location, nearest first, as an (n, k) index array.
+# From a passed-in matrix, rows are scanned a block at a time; from locations alone the k-d tree
+# is searched instead, in O(n log n) rather than O(n^2) time.
+def nearest_neighbors(locations, k, dist_matrix=None, block_rows=DEFAULT_BLOCK_ROWS):
+    if dist_matrix is None:
+        return k_nearest_neighbors(locations, k)
+    n = len(dist_matrix)
+    k = max(0, min(k, n - 1))
+    neighbors = np.empty((n, k), dtype=np.intp)
+    if k == 0:
+        return neighbors
+    for start in range(0, n, block_rows):
+        rows = np.arange(start, min(start + block_rows, n))
+        block = np.array(dist_matrix[rows], dtype=np.float64)
+        block[np.arange(len(rows)), rows] = np.inf  # A location is not its own neighbor
+        nearest = np.argpartition(block, k - 1, axis=1)[:, :k]
+        order = np.argsort(np.take_along_axis(block, nearest, axis=1), axis=1)
+        neighbors[rows] = np.take_along_axis(nearest, order, axis=1)
+    return neighbors
@@ -0,0 +1,413 @@
+"""
+Exact solvers for small routes and lower bounds for any route.
+
+Up to HELD_KARP_MAX_STOPS stops, held_karp solves the route optimally by
+bitmask dynamic programming. Up to EXACT_MAX_STOPS, branch_and_bound searches
+from the heuristic route, pruning with 1-tree bounds, and proves it optimal
+or improves it within its time budget. lower_bound gives the Held-Karp 1-tree
+bound of any route up to MATRIX_MAX_STOPS stops, and optimality_gap turns a
+bound into how much longer than optimal a route can at most be.
+"""
+import time
+import numpy as np
+from cost_matrix import is_symmetric
+from distance_matrix import distance_matrix
+from functions import nearest_neighbor, MATRIX_MAX_STOPS, COMPILED_KERNELS
+from local_search import improve_route
+from profiling import count, phase
+import kernels
+
+HELD_KARP_MAX_STOPS = 17  # Depot included; the DP table has 2**16 x 16 entries
+EXACT_MAX_STOPS = 25  # Largest route branch_and_bound is tried on
+EXACT_TIME_BUDGET = 1.0  # Seconds for branch_and_bound before it settles for the best route found
+BOUND_TIME_BUDGET = 0.25  # Seconds of subgradient iterations per lower bound
+BOUND_ITERATIONS = 100
+ROOT_ITERATIONS = 1000  # Subgradient iterations at the root of branch_and_bound; stops early once the route is proven
+NODE_ITERATIONS = 25  # Per branch_and_bound node, starting from the parent's penalties
+BOUND_MIN_ITERATIONS = 10  # Run even when the time budget is gone, e.g. spent compiling the kernel
+EPSILON = 1e-9
+PROOF_TOLERANCE = 1e-6  # Relative; subgradient bounds only approach the optimum, so a route this close counts as proven
+
+
+def _closed(order, dist):
+    route = [0] + [int(c) for c in order] + [0]
+    return route, float(dist[route[:-1], route[1:]].sum())
+
+
+def held_karp(dist_matrix, upper_bound=None):
+    """
+    Optimal closed route by bitmask dynamic programming over subsets of stops.
+
+    cost[S, j] is the shortest path from the depot through the stops in bitmask S
+    ending at stop j; each popcount layer is computed from the previous one with
+    a few vectorized NumPy operations per j. States that cannot beat upper_bound
+    even if every remaining stop is reached by its cheapest edge are pruned.
+
+    Parameters:
+    dist_matrix (numpy array): Distance or cost matrix (may be asymmetric) with at most HELD_KARP_MAX_STOPS rows.
+    upper_bound (float, optional): Length of a known route, e.g. from a heuristic.
+
+    Returns:
+    tuple: The optimal route (starting and ending at stop 0) and its distance.
+    """
+    dist = np.asarray(dist_matrix, dtype=np.float64)
+    n = len(dist)
+    if n > HELD_KARP_MAX_STOPS:
+        raise ValueError(f"held_karp takes at most {HELD_KARP_MAX_STOPS} stops, got {n}")
+    if n <= 3:
+        route = list(range(n)) + [0] if n else [0, 0]
+        return route, float(dist[route[:-1], route[1:]].sum()) if n else 0.0
+
+    m = n - 1  # Stop i + 1 is bit i
+    size = 1 << m
+    d = dist[1:, 1:]
+    cost = np.full((size, m), np.inf)
+    parent = np.full((size, m), -1, dtype=np.int8)
+    bits = np.arange(m)
+    cost[1 << bits, bits] = dist[0, 1:]
+
+    masks = np.arange(size)
+    popcount = np.zeros(size, dtype=np.int8)
+    reached = np.zeros(size)  # Cheapest incoming edges of the stops in each subset
+    cheapest_in = np.where(np.eye(n, dtype=bool), np.inf, dist).min(axis=0)
+    for j in range(m):
+        has_j = (masks >> j) & 1
+        popcount += has_j.astype(np.int8)
+        reached += has_j * cheapest_in[j + 1]
+    remaining = cheapest_in[1:].sum() - reached + cheapest_in[0]  # Still needed to finish from each subset
+    alive = np.ones(size, dtype=bool)
+
+    for k in range(2, m + 1):
+        layer = masks[popcount == k]
+        for j in range(m):
+            subsets = layer[(layer >> j) & 1 == 1]
+            previous = subsets ^ (1 << j)
+            keep = alive[previous]
+            subsets, previous = subsets[keep], previous[keep]
+            candidates = cost[previous] + d[:, j]
+            best = np.argmin(candidates, axis=1)
+            cost[subsets, j] = candidates[np.arange(len(subsets)), best]
+            parent[subsets, j] = best
+        if upper_bound is not None:
+            pruned = cost[layer] + remaining[layer, None] > upper_bound + EPSILON
+            cost[layer[:, None], bits] = np.where(pruned, np.inf, cost[layer])
+            count("held_karp_pruned", int(pruned.sum()))
+        alive[layer] = np.isfinite(cost[layer]).any(axis=1)
+
+    full = size - 1
+    totals = cost[full] + dist[1:, 0]
+    j = int(np.argmin(totals))
+    if not np.isfinite(totals[j]):  # upper_bound was below the optimum; solve again without it
+        return held_karp(dist)
+    order, subset = [], full
+    while j >= 0:
+        order.append(j + 1)
+        subset, j = subset ^ (1 << j), int(parent[subset, j])
+    return _closed(order[::-1], dist)
+
+
+# Weight of a minimum spanning tree (Prim) over `nodes` with costs w[i, j] + pi[i] + pi[j],
+# plus each node's degree in the tree and its parent (a position in `nodes`; the first
+# node is the root). One row of the matrix is read per step.
+def _spanning_tree(w, pi, nodes):
+    if COMPILED_KERNELS:
+        return kernels.spanning_tree(w, pi, np.asarray(nodes, dtype=np.int64))
+    return _reference_spanning_tree(w, pi, nodes)
+
+
+def _reference_spanning_tree(w, pi, nodes):
+    k = len(nodes)
+    in_tree = np.zeros(k, dtype=bool)
+    in_tree[0] = True
+    best = w[nodes[0], nodes] + pi[nodes[0]] + pi[nodes]
+    link = np.zeros(k, dtype=np.intp)
+    degree = np.zeros(k, dtype=np.intp)
+    total = 0.0
+    for _ in range(k - 1):
+        best[in_tree] = np.inf
+        j = int(np.argmin(best))
+        total += best[j]
+        degree[j] += 1
+        degree[link[j]] += 1
+        in_tree[j] = True
+        row = w[nodes[j], nodes] + pi[nodes[j]] + pi[nodes]
+        closer = (row < best) & ~in_tree
+        best[closer] = row[closer]
+        link[closer] = j
+    return total, degree, link
+
+
+# Held-Karp 1-tree bound with subgradient optimization on a symmetric matrix:
+# the best bound found and the node penalties that gave it
+def _one_tree(sym, upper_bound=None, time_budget=BOUND_TIME_BUDGET, max_iterations=BOUND_ITERATIONS):
+    start_time = time.perf_counter()
+    n = len(sym)
+    pi = np.zeros(n)
+    best, best_pi = -np.inf, pi.copy()
+    others = np.arange(1, n)
+    step = 2.0
+    stale = 0
+    for k in range(1, max_iterations + 1):
+        # Spanning tree of stops 1..n-1 plus the depot's two cheapest edges
+        tree, degree, _ = _spanning_tree(sym, pi, others)
+        depot = sym[0, others] + pi[0] + pi[others]
+        a, b = np.argpartition(depot, 1)[:2]
+        bound = tree + depot[a] + depot[b] - 2 * pi.sum()
+        degrees = np.concatenate(([2], degree))
+        degrees[a + 1] += 1
+        degrees[b + 1] += 1
+        count("one_tree_iterations")
+        if bound > best + EPSILON:
+            best, best_pi, stale = bound, pi.copy(), 0
+        else:
+            stale += 1
+            if stale >= 5:
+                step, stale = step / 2, 0
+        g = degrees - 2
+        if not g.any():
+            break  # The 1-tree is a tour, so the bound is the optimum
+        target = upper_bound if upper_bound is not None else 1.05 * bound
+        pi = pi + step * max(target - bound, EPSILON * abs(bound)) / (g @ g) * g
+        if time_budget is not None and k >= BOUND_MIN_ITERATIONS and time.perf_counter() - start_time > time_budget:
+            break
+    return best, best_pi
+
+
+# 1-tree of all stops on costs w + pi, the depot (stop 0) being the special node. Forbidden
+# edges are inf in w; forced edges are priced below every other edge so the tree always
+# holds them, and their real cost is added back. Returns the bound, every stop's degree
+# and the tree's edges as a list of (i, j) pairs.
+def _constrained_one_tree(w, forced, pi, scale):
+    n = len(w)
+    big = 2 * (scale + 2 * np.abs(pi).max()) + 1
+    cost = np.where(forced, -big, w) if forced.any() else w
+    others = np.arange(1, n)
+    tree, degree, link = _spanning_tree(cost, pi, others)
+    depot = cost[0, others] + pi[0] + pi[others]
+    a, b = np.argpartition(depot, 1)[:2]
+    bound = tree + depot[a] + depot[b] - 2 * pi.sum() + (big + w[forced]).sum() / 2
+    degrees = np.concatenate(([2], degree))
+    degrees[a + 1] += 1
+    degrees[b + 1] += 1
+    edges = [(int(others[t]), int(others[link[t]])) for t in range(1, n - 1)] + [(0, int(others[a])), (0, int(others[b]))]
+    return bound, degrees, edges
+
+
+# Subgradient optimization of the constrained 1-tree from penalties pi. Stops early once the
+# bound reaches upper_bound (nothing to find below it) or the tree is a tour (the bound is exact).
+def _node_bound(w, forced, pi, scale, upper_bound, iterations, step):
+    best = (-np.inf, pi, None, None)
+    stale = 0
+    for _ in range(iterations):
+        bound, degrees, edges = _constrained_one_tree(w, forced, pi, scale)
+        count("one_tree_iterations")
+        if not np.isfinite(bound):
+            return bound, pi, degrees, edges  # Forbidden edges disconnect the stops
+        if bound > best[0] + EPSILON:
+            best, stale = (bound, pi, degrees, edges), 0
+        else:
+            stale += 1
+            if stale >= 2 * len(w):  # Clustered stops need penalties to grow for a long time
+                step, stale = step / 2, 0
+        g = degrees - 2
+        if bound >= upper_bound * (1 - PROOF_TOLERANCE) or not g.any():
+            return bound, pi, degrees, edges
+        pi = pi + step * (upper_bound - bound) / (g @ g) * g
+    return best
+
+
+# Force edge (i, j) into every tour of a branch, or False when it would close a cycle that
+# is not a full tour. Stops whose two tour edges are now known lose all their other edges.
+def _force(w, forced, i, j):
+    # Walk the forced path from j away from i; reaching i means (i, j) closes a cycle
+    previous, c = i, j
+    while True:
+        nxt = [k for k in np.flatnonzero(forced[c]) if k != previous]
+        if not nxt:
+            break
+        previous, c = c, int(nxt[0])
+        if c == i:
+            break
+    if c == i and forced.sum() // 2 + 1 < len(w):
+        return False
+    forced[i, j] = forced[j, i] = True
+    for c in (i, j):
+        if forced[c].sum() == 2:
+            w[c, ~forced[c]] = w[~forced[c], c] = np.inf
+    return True
+
+
+def branch_and_bound(dist_matrix, route=None, time_budget=EXACT_TIME_BUDGET):
+    """
+    Held-Karp 1-tree branch and bound (Volgenant and Jonker's edge branching).
+
+    Every search node computes a 1-tree bound by subgradient optimization,
+    starting from its parent's node penalties. A node whose bound reaches the
+    best route is pruned; one whose 1-tree is a tour has found its best route.
+    Otherwise a stop of degree above two in the 1-tree is branched on: one of
+    its free tree edges is forbidden, or forced with a second one forbidden, or
+    both are forced. Asymmetric matrices are solved on the usual symmetric
+    transformation with an in and an out node per stop. The search starts from
+    the locally improved route, so its bound is tight from the first node.
+
+    Parameters:
+    dist_matrix (numpy array): Distance or cost matrix (may be asymmetric).
+    route (list, optional): Known closed route to start from, e.g. from a heuristic.
+    time_budget (float, optional): Seconds before the search stops with the best route so far.
+
+    Returns:
+    tuple: The best route found, its distance and whether it was proven optimal.
+    """
+    start_time = time.perf_counter()
+    dist = np.asarray(dist_matrix, dtype=np.float64)
+    n = len(dist)
+    if n <= 3:
+        return *held_karp(dist), True
+    if route is None:
+        route, _ = nearest_neighbor(None, dist)
+    route, _ = improve_route(route, None, dist, time_budget=None)
+    best_route = [int(c) for c in route]
+    best = float(dist[best_route[:-1], best_route[1:]].sum())
+
+    if is_symmetric(dist):
+        w = dist.copy()
+        forced = np.zeros((n, n), dtype=bool)
+    else:
+        # Stop i is node i (in) and node n + i (out); the tour enters i, leaves from n + i
+        w = np.full((2 * n, 2 * n), np.inf)
+        w[n:, :n] = np.where(np.eye(n, dtype=bool), np.inf, dist)
+        w[:n, n:] = w[n:, :n].T
+        forced = np.zeros((2 * n, 2 * n), dtype=bool)
+        forced[np.arange(n), np.arange(n) + n] = forced[np.arange(n) + n, np.arange(n)] = True
+        w[np.arange(n), np.arange(n) + n] = w[np.arange(n) + n, np.arange(n)] = 0.0
+    np.fill_diagonal(w, np.inf)
+    scale = np.abs(w[np.isfinite(w)]).max()
+
+    # Depth-first; each entry is a node's costs, forced edges and its parent's penalties
+    stack = [(w, forced, np.zeros(len(w)), ROOT_ITERATIONS, 2.0)]
+    nodes = 0
+    complete = True
+    while stack:
+        if time_budget is not None and time.perf_counter() - start_time > time_budget:
+            complete = False
+            break
+        w, forced, pi, iterations, step = stack.pop()
+        nodes += 1
+        bound, pi, degrees, edges = _node_bound(w, forced, pi, scale, best, iterations, step)
+        if not bound < best * (1 - PROOF_TOLERANCE):
+            continue
+        if not (degrees - 2).any():
+            # The 1-tree is a tour, so no route in this branch is shorter
+            best_route, best = _tour_route(edges, n, len(w) > n, dist)
+            continue
+
+        # Branch on a stop of the highest degree and two of its tree edges that are not forced yet
+        c = int(np.argmax(degrees))
+        free = [e for e in edges if c in e and not forced[e]]
+        (i, j), rest = free[0], free[1:]
+        children = []
+        w1 = w.copy()
+        w1[i, j] = w1[j, i] = np.inf
+        children.append((w1, forced))
+        w2, f2 = w.copy(), forced.copy()
+        if _force(w2, f2, i, j):
+            if forced[c].any() or not rest:
+                children.append((w2, f2))
+            else:
+                k, m = rest[0]
+                w3, f3 = w2.copy(), f2.copy()
+                w2[k, m] = w2[m, k] = np.inf
+                children.append((w2, f2))
+                if _force(w3, f3, k, m):
+                    children.append((w3, f3))
+        for child_w, child_forced in reversed(children):
+            stack.append((child_w, child_forced, pi, NODE_ITERATIONS, 1.0))
+    count("branch_and_bound_nodes", nodes)
+    return best_route, best, complete
+
+
+# Closed route from the edges of a 1-tree that is a tour (of the in/out nodes when split)
+def _tour_route(edges, n, split, dist):
+    size = 2 * n if split else n
+    adjacent = [[] for _ in range(size)]
+    for i, j in edges:
+        adjacent[i].append(j)
+        adjacent[j].append(i)
+    # Walking from the depot's in node to its out node visits the stops in driving order
+    cycle = [0, n if split else adjacent[0][0]]
+    while len(cycle) < size:
+        a, b = adjacent[cycle[-1]]
+        cycle.append(b if a == cycle[-2] else a)
+    stops = [c for c in cycle if c < n]
+    return _closed(stops[1:], dist)
+
+
+def solve_exact(dist_matrix, route=None, time_budget=EXACT_TIME_BUDGET):
+    """
+    Held-Karp for up to HELD_KARP_MAX_STOPS stops, branch_and_bound above that.
+
+    Returns:
+    tuple: The route, its distance and whether it is proven optimal.
+    """
+    with phase("exact"):
+        dist = np.asarray(dist_matrix, dtype=np.float64)
+        upper_bound = None if route is None else float(dist[route[:-1], route[1:]].sum())
+        if len(dist) <= HELD_KARP_MAX_STOPS:
+            return *held_karp(dist, upper_bound), True
+        return branch_and_bound(dist, route, time_budget)
+
+
+def lower_bound(locations, dist_matrix=None, upper_bound=None, time_budget=BOUND_TIME_BUDGET):
+    """
+    Lower bound on the shortest closed route through all stops: the Held-Karp
+    1-tree bound, typically within a few percent of the optimum. Up to
+    HELD_KARP_MAX_STOPS stops the bound is the optimal distance itself.
+
+    Parameters:
+    locations (array-like): An (n, 2) array of [latitude, longitude] coordinates.
+    dist_matrix (numpy array, optional): Distance or cost matrix; haversine distances are used otherwise.
+    upper_bound (float, optional): Length of a known route; speeds up the subgradient steps.
+    time_budget (float, optional): Seconds of subgradient iterations.
+
+    Returns:
+    float: The bound, or None above MATRIX_MAX_STOPS stops without a matrix.
+    """
+    n = len(locations) if dist_matrix is None else len(dist_matrix)
+    if n <= 1:
+        return 0.0
+    if dist_matrix is None and n > MATRIX_MAX_STOPS:
+        return None
+    with phase("bound"):
+        dist = distance_matrix(locations) if dist_matrix is None else np.asarray(dist_matrix, dtype=np.float64)
+        if n <= HELD_KARP_MAX_STOPS:
+            return float(held_karp(dist)[1])  # Small enough for the optimum itself
+        if not is_symmetric(dist):
+            dist = np.minimum(dist, dist.T)  # A lower bound for either direction of travel
+        return float(max(_one_tree(dist, upper_bound, time_budget)[0], 0.0))
+
+
+# How much longer than optimal a route of this length can at most be, as a fraction (0.02 is 2%)
+def optimality_gap(distance, bound):
+    if bound is None:
+        return None
+    if bound <= EPSILON:
+        return 0.0 if distance <= EPSILON else None
+    return float(max(distance - bound, 0.0) / bound)
+
+
+def route_bounds(routes, route_distances, locations, dist_matrix=None, time_budget=BOUND_TIME_BUDGET):
+    """
+    Lower bound and optimality gap of every vehicle's route, each over its own stops.
+
+    Returns:
+    tuple: Per-route lower bounds and gaps (None where no bound is available).
+    """
+    locations = np.asarray(locations, dtype=np.float64)
+    bounds, gaps = [], []
+    for route, distance in zip(routes, route_distances):
+        stops = np.asarray(route[:-1], dtype=np.intp)
+        sub = None if dist_matrix is None else np.asarray(dist_matrix)[np.ix_(stops, stops)]
+        bound = lower_bound(locations[stops], sub, distance, time_budget)
+        bounds.append(bound)
+        gaps.append(optimality_gap(distance, bound))
+    return bounds, gaps
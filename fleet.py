@@ -0,0 +1,149 @@
+from concurrent.futures import ProcessPoolExecutor
+import time
+import numpy as np
+from spatial_index import to_unit_sphere
+from distance_matrix import distance_matrix
+from functions import nearest_neighbor, total_distance
+from local_search import improve_route, DEFAULT_TIME_BUDGET
+from exact import solve_exact, EXACT_MAX_STOPS
+from profiling import phase
+
+KMEANS_ITERATIONS = 50
+DEPOT = 0  # Every vehicle starts and ends its route at stop 0
+
+
+# k-means on unit-sphere coordinates with k-means++ seeding; returns the (k, 3) centers
+def kmeans_centers(points, k, rng, iterations=KMEANS_ITERATIONS):
+    centers = [points[rng.integers(len(points))]]
+    closest = ((points - centers[0]) ** 2).sum(axis=1)
+    for _ in range(1, k):
+        total = closest.sum()
+        index = rng.choice(len(points), p=closest / total) if total > 0 else rng.integers(len(points))
+        centers.append(points[index])
+        closest = np.minimum(closest, ((points - points[index]) ** 2).sum(axis=1))
+    centers = np.array(centers)
+
+    for _ in range(iterations):
+        labels = np.argmin(((points[:, None, :] - centers[None]) ** 2).sum(axis=2), axis=1)
+        counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centers)
+        np.add.at(sums, labels, points)
+        moved = np.where(counts[:, None] > 0, sums / np.maximum(counts, 1)[:, None], centers)
+        if np.allclose(moved, centers):
+            break
+        centers = moved
+    return centers
+
+
+def partition_stops(locations, n_vehicles, capacities=None, demands=None, seed=None):
+    """
+    Splits the delivery stops (everything except the depot, stop 0) between vehicles.
+
+    Stops are clustered with k-means. When capacities are given, stop-to-cluster
+    pairs are assigned closest first, skipping clusters that are already full.
+
+    Parameters:
+    locations (array-like): An (n, 2) array of [latitude, longitude] coordinates.
+    n_vehicles (int): Number of vehicles.
+    capacities (array-like, optional): Capacity of each vehicle.
+    demands (array-like, optional): Demand of each stop (defaults to 1 per stop).
+    seed (int, optional): Seed for the k-means initialization.
+
+    Returns:
+    list: One array of stop indices per vehicle.
+    """
+    stops = np.arange(1, len(locations))
+    demands = np.ones(len(locations)) if demands is None else np.asarray(demands, dtype=np.float64)
+    if capacities is not None:
+        capacities = np.asarray(capacities, dtype=np.float64)
+        if len(capacities) != n_vehicles:
+            raise ValueError("Expected one capacity per vehicle")
+        if capacities.sum() < demands[stops].sum():
+            raise ValueError("Total vehicle capacity is smaller than the total demand")
+    if len(stops) == 0:
+        return [stops[:0] for _ in range(n_vehicles)]
+
+    rng = np.random.default_rng(seed)
+    points = to_unit_sphere(np.asarray(locations)[stops])
+    k = min(n_vehicles, len(stops))
+    centers = kmeans_centers(points, k, rng)
+    sq_dist = ((points[:, None, :] - centers[None]) ** 2).sum(axis=2)
+
+    if capacities is None:
+        labels = np.argmin(sq_dist, axis=1)
+    else:
+        # Largest vehicles take the k clusters, then pairs are assigned closest first
+        vehicles = np.argsort(-capacities)[:k]
+        remaining = capacities[vehicles].copy()
+        labels = np.full(len(stops), -1)
+        assigned = 0
+        for flat in np.argsort(sq_dist, axis=None):
+            stop, cluster = divmod(int(flat), k)
+            if labels[stop] < 0 and remaining[cluster] >= demands[stops[stop]]:
+                labels[stop] = cluster
+                remaining[cluster] -= demands[stops[stop]]
+                assigned += 1
+                if assigned == len(stops):
+                    break
+        unassigned = np.flatnonzero(labels < 0)
+        if len(unassigned):
+            raise ValueError(f"{len(unassigned)} stops do not fit in any vehicle's remaining capacity")
+
+    clusters = [stops[labels == cluster] for cluster in range(k)]
+    if capacities is not None:
+        by_vehicle = [stops[:0] for _ in range(n_vehicles)]
+        for cluster, vehicle in enumerate(vehicles):
+            by_vehicle[vehicle] = clusters[cluster]
+        return by_vehicle
+    return clusters + [stops[:0] for _ in range(n_vehicles - k)]
+
+
+# Route one vehicle's stops with the single-vehicle route builder; runs in a pool worker.
+# When a cost matrix (the cluster's rows and columns only) is given it replaces haversine distances.
+# With improve, van-sized routes (up to EXACT_MAX_STOPS stops) are then solved exactly in what is left of time_budget.
+def solve_cluster(locations, improve=True, time_budget=DEFAULT_TIME_BUDGET, cost_matrix=None):
+    start_time = time.perf_counter()
+    route, _ = nearest_neighbor(locations, cost_matrix)
+    if improve:
+        route, _ = improve_route(route, locations, cost_matrix, time_budget=time_budget)
+        if len(locations) <= EXACT_MAX_STOPS:
+            remaining = None if time_budget is None else max(time_budget - (time.perf_counter() - start_time), 0.0)
+            route, distance, _ = solve_exact(distance_matrix(locations) if cost_matrix is None else cost_matrix,
+                                             route, remaining)
+            return route, distance
+    return route, total_distance(route, locations, cost_matrix)
+
+
+def solve_fleet(locations, n_vehicles, capacities=None, demands=None, improve=True,
+                time_budget=DEFAULT_TIME_BUDGET, workers=None, seed=None, cost_matrix=None):
+    """
+    Cluster-first, route-second solver for several vehicles sharing the depot (stop 0).
+
+    Each vehicle's stops are routed independently and concurrently on a
+    ProcessPoolExecutor (workers=None uses one process per CPU, workers=1 solves
+    in-process). Clustering always uses the coordinates; routing uses cost_matrix
+    (e.g. asymmetric travel times) when one is given.
+
+    Returns:
+    tuple: Per-vehicle routes (global stop indices, starting and ending at the
+    depot) and per-vehicle distances in km (or cost_matrix units).
+    """
+    locations = np.asarray(locations, dtype=np.float64)
+    with phase("partition"):
+        clusters = partition_stops(locations, n_vehicles, capacities, demands, seed)
+    members = [np.concatenate(([DEPOT], cluster)) for cluster in clusters]
+    sub_locations = [locations[ids] for ids in members]
+    sub_costs = [None if cost_matrix is None else cost_matrix[np.ix_(ids, ids)] for ids in members]
+    args = ([improve] * n_vehicles, [time_budget] * n_vehicles, sub_costs)
+
+    if workers == 1:
+        results = list(map(solve_cluster, sub_locations, *args))
+    else:
+        with ProcessPoolExecutor(workers) as executor:
+            results = list(executor.map(solve_cluster, sub_locations, *args))
+
+    routes, distances = [], []
+    for ids, (route, distance) in zip(members, results):
+        routes.append(ids[route].tolist())
+        distances.append(distance)
+    return routes, distances
@@ -1,10 +1,25 @@
 import numpy as np
 from math import radians, sin, cos, sqrt, atan2
 import time
-import plotly.graph_objects as go
-import matplotlib.pyplot as plt
-import streamlit as st
-import pandas as pd
+# streamlit, plotly, matplotlib and pandas are imported inside the rendering functions,
+# so headless solves (batch jobs, pool workers) don't pay for loading them
+from distance_matrix import distance_matrix, haversine_pairs, nearest_neighbors
+from spatial_index import nearest_neighbor_tour
+from time_windows import schedule
+from profiling import phase, count
+import kernels
+
+# Above this many stops nearest_neighbor uses the spatial index by default,
+# so the n x n distance matrix is never materialized
+MATRIX_MAX_STOPS = 5000
+
+# Ants only choose among this many nearest stops, unless all of them are already visited
+ACO_CANDIDATES = 15
+
+# Long routes are sampled down to at most this many animation frames in simulate_route
+MAX_FRAMES = 300
+MIN_DISTANCE = 1e-9  # Guards visibility and pheromone deposits against zero-length legs
+COMPILED_KERNELS = kernels.BACKEND == "numba"  # Route lengths are summed in compiled loops
  
 #  Haversine function to calculate distance between two points
 def haversine(lat1, lon1, lat2, lon2):
@@ -17,34 +32,61 @@ def haversine(lat1, lon1, lat2, lon2):
     return distance
 
 # Function to calculate total distance of a route
-def total_distance(route, locations):
-    distance = 0
-    for i in range(len(route) - 1):
-        distance += haversine(locations[route[i]][0], locations[route[i]][1], locations[route[i+1]][0], locations[route[i+1]][1])
-    return distance
+# Indexes into a precomputed distance or cost matrix (any supported dtype, possibly
+# asymmetric) when one is given, otherwise
+# evaluates all legs of the route in a single vectorized haversine pass
+# (or a compiled loop over the legs, without temporaries, when numba is available)
+def total_distance(route, locations, dist_matrix=None):
+    route = np.asarray(route, dtype=np.intp)
+    if len(route) < 2:
+        return 0.0
+    if dist_matrix is not None:
+        if COMPILED_KERNELS:
+            return float(kernels.route_length(route, np.asarray(dist_matrix)))
+        return float(dist_matrix[route[:-1], route[1:]].sum(dtype=np.float64))
+    if COMPILED_KERNELS:
+        return float(kernels.route_length_coords(route, np.asarray(locations, dtype=np.float64)))
+    points = np.asarray(locations, dtype=np.float64)[route]
+    return float(haversine_pairs(points[:-1, 0], points[:-1, 1], points[1:, 0], points[1:, 1]).sum())
 
 # Function to calculate adaptability to constraints
-def adaptability_to_constraints(route, delivery_windows):
+# With travel times, the route is simulated (arrival, waiting, service) against every window;
+# without them only the order of window openings is checked
+def adaptability_to_constraints(route, delivery_windows, travel_times=None, service_times=None):
+    if travel_times is not None:
+        return schedule(route, travel_times, delivery_windows, service_times).feasible
     for i in range(len(route) - 1):
         if not (delivery_windows[route[i]][0] <= delivery_windows[route[i+1]][0] <= delivery_windows[route[i]][1]):
             return False
     return True
 
 # Function to display metrics
-def display_metrics(locations, delivery_windows):
-    route, exec_time = nearest_neighbor(locations)
-    total_dist = total_distance(route, locations)
-    adapt_constraints = adaptability_to_constraints(route, delivery_windows)
-    num_routes = 1  # Assuming single vehicle for simplicity
+def display_metrics(locations, delivery_windows, n_vehicles=1):
+    if n_vehicles > 1:
+        from fleet import solve_fleet  # fleet builds on this module
+        start_time = time.perf_counter()
+        routes, distances = solve_fleet(locations, n_vehicles)
+        exec_time = time.perf_counter() - start_time
+        total_dist = sum(distances)
+    else:
+        dist_matrix = distance_matrix(locations)
+        route, exec_time = nearest_neighbor(locations, dist_matrix)
+        routes = [route]
+        total_dist = total_distance(route, locations, dist_matrix)
+    adapt_constraints = all(adaptability_to_constraints(route, delivery_windows) for route in routes)
+    num_routes = sum(1 for route in routes if len(route) > 2)
 
     print(f"Total Distance: {total_dist} km")
     print(f"Execution Time: {exec_time} seconds")
     print(f"Adaptability to Constraints: {'Yes' if adapt_constraints else 'No'}")
     print(f"Number of Routes/Trips: {num_routes}")
-    return route
+    return routes[0] if n_vehicles == 1 else routes
 
 
 def plot_route(locations, route):
+    import matplotlib.pyplot as plt
+    import streamlit as st
+
     # Extract the route coordinates
     lats = [locations[i][0] for i in route]
     lons = [locations[i][1] for i in route]
@@ -85,18 +127,111 @@ def plot_route(locations, route):
 
 # define the Nearest Neighbor function
 # Nearest Neighbor algorithm to create a sample route
-def nearest_neighbor(locations):
-    start_time = time.time()
-    unvisited = list(range(1, len(locations)))
-    route = [0]
-    while unvisited:
-        nearest = min(unvisited, key=lambda x: haversine(locations[route[-1]][0], locations[route[-1]][1], locations[x][0], locations[x][1]))
-        route.append(nearest)
-        unvisited.remove(nearest)
-    route.append(0)
-    execution_time = time.time() - start_time
+# backend="matrix": each step is one argmin over a row of the distance matrix (built here if not given)
+# backend="kdtree": each step is a nearest-unvisited query on a k-d tree, in linear memory
+# Any cost matrix works for the matrix backend (locations may then be None); rows are the "from" stop
+def nearest_neighbor(locations, dist_matrix=None, backend=None):
+    start_time = time.perf_counter()
+    if backend is None:
+        backend = "matrix" if dist_matrix is not None or len(locations) <= MATRIX_MAX_STOPS else "kdtree"
+    if backend == "kdtree":
+        route = nearest_neighbor_tour(locations)
+        count("kdtree_queries", len(locations) - 1)
+    elif backend == "matrix":
+        if dist_matrix is None:
+            with phase("matrix"):
+                dist_matrix = distance_matrix(locations)
+        unvisited = np.arange(1, len(dist_matrix))
+        route = [0]
+        while len(unvisited):
+            k = int(np.argmin(dist_matrix[route[-1], unvisited]))
+            route.append(int(unvisited[k]))
+            unvisited = np.delete(unvisited, k)
+        route.append(0)
+        count("distance_evaluations", len(dist_matrix) * (len(dist_matrix) - 1) // 2)
+    else:
+        raise ValueError(f"Unknown nearest neighbor backend: {backend}")
+    execution_time = time.perf_counter() - start_time
     return route, execution_time
 
+# Ant Colony Optimization algorithm
+# All ants build their tours in lockstep, so each construction step is a handful of
+# NumPy operations over an (n_ants, n_candidates) array instead of nested Python loops.
+# callback(route, distance) is called whenever the best route improves; setting the
+# `stop` event (e.g. a threading.Event) ends the search after the current iteration.
+# `pheromones` is an optional (n, n) float64 starting trail, e.g. from warm_start, instead of
+# the uniform 1 / n; it is updated in place, so afterwards it holds the final trail.
+def ant_colony_optimization(dist_matrix, n_ants=10, n_iterations=100, alpha=1.0, beta=5.0, evaporation_rate=0.5,
+                            pheromone_constant=100.0, n_candidates=ACO_CANDIDATES, seed=None, time_budget=None,
+                            callback=None, stop=None, pheromones=None):
+    start_time = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    dist = np.asarray(dist_matrix)  # No copy, so int16 or memory-mapped matrices stay compact
+    n = len(dist)
+    if n < 3:
+        route = list(range(n)) + [0] if n else [0, 0]
+        return route, total_distance(route, None, dist) if n else 0.0
+
+    candidates = nearest_neighbors(None, n_candidates, dist)
+    rows = np.arange(n)[:, None]
+    visibility = (1 / np.maximum(dist, MIN_DISTANCE)) ** beta
+    candidate_visibility = visibility[rows, candidates]
+    if pheromones is None:
+        pheromones = np.ones((n, n)) / n
+    ants = np.arange(n_ants)
+    best_route = None
+    best_distance = float('inf')
+
+    for iteration in range(n_iterations):
+        routes = np.zeros((n_ants, n + 1), dtype=np.intp)
+        visited = np.zeros((n_ants, n), dtype=bool)
+        visited[:, 0] = True
+        current = routes[:, 0]
+        for step in range(1, n):
+            cand = candidates[current]
+            weights = pheromones[current[:, None], cand] ** alpha * candidate_visibility[current]
+            weights[visited[ants[:, None], cand]] = 0
+            cumulative = np.cumsum(weights, axis=1)
+            totals = cumulative[:, -1]
+
+            # Roulette-wheel selection for all ants at once; threshold is in (0, total]
+            threshold = (1 - rng.random(n_ants)) * totals
+            picks = np.minimum((cumulative < threshold[:, None]).sum(axis=1), cand.shape[1] - 1)
+            next_nodes = cand[ants, picks]
+
+            # Ants whose candidates are all visited take the best unvisited stop overall
+            stuck = np.flatnonzero(totals <= 0)
+            if len(stuck):
+                fallback = pheromones[current[stuck]] ** alpha * visibility[current[stuck]]
+                fallback[visited[stuck]] = -1
+                next_nodes[stuck] = np.argmax(fallback, axis=1)
+
+            routes[:, step] = next_nodes
+            visited[ants, next_nodes] = True
+            current = next_nodes
+
+        # Update pheromones in place: evaporate, then deposit along every ant's route
+        distances = dist[routes[:, :-1], routes[:, 1:]].sum(axis=1, dtype=np.float64)
+        pheromones *= (1 - evaporation_rate)
+        np.add.at(pheromones, (routes[:, :-1], routes[:, 1:]),
+                  (pheromone_constant / np.maximum(distances, MIN_DISTANCE))[:, None])
+
+        best_ant = int(np.argmin(distances))
+        if distances[best_ant] < best_distance:
+            best_distance = float(distances[best_ant])
+            best_route = routes[best_ant].tolist()
+            if callback is not None:
+                callback(best_route, best_distance)
+        count("aco_iterations")
+        count("distance_evaluations", n_ants * n)
+
+        if time_budget is not None and time.perf_counter() - start_time > time_budget:
+            break
+        if stop is not None and stop.is_set():
+            break
+
+    return best_route, best_distance
+
 # Function to convert distance based on the selected unit
 def convert_distance(distance_km, unit):
     if unit == "Miles":
@@ -191,7 +326,7 @@ def convert_distance(distance_km, unit):
 
 
 
-def simulate_route(optimized_route, locations, speed=500):
+def simulate_route(optimized_route, locations, speed=500, mode="incremental", max_frames=MAX_FRAMES):
     """
     Simulates a route on a map and visualizes it using Plotly.
 
@@ -199,7 +334,26 @@ def simulate_route(optimized_route, locations, speed=500):
     optimized_route (list): A list of indices representing the optimized route.
     locations (numpy array): An array of [latitude, longitude] coordinates.
     speed (int, optional): The duration of each frame in milliseconds. Default is 500ms.
+    mode (str, optional): "incremental" (default) sends only the legs driven since the previous
+    frame, so the page weight grows linearly with the route; "cumulative" redraws the whole
+    route driven so far in every frame.
+    max_frames (int, optional): Routes with more stops are sampled down to this many frames.
     """
+    import streamlit as st
+
+    with phase("render.figure"):
+        fig_2 = route_figure(optimized_route, locations, speed, mode, max_frames)
+
+    # Render the animated map figure in Streamlit (Plotly serializes the figure here)
+    with phase("render.plotly_chart"):
+        st.plotly_chart(fig_2)
+
+
+# Builds the animated Plotly map figure for simulate_route
+def route_figure(optimized_route, locations, speed=500, mode="incremental", max_frames=MAX_FRAMES):
+    import pandas as pd
+    import plotly.graph_objects as go
+
     speed = (10 - speed) * 100
     # Create a DataFrame with city names and coordinates
     city_route = [f"Location {i}" for i in optimized_route]
@@ -241,20 +395,38 @@ def simulate_route(optimized_route, locations, speed=500):
         name='Route'
     ))
 
-    # Create frames for animation (one point at a time)
+    # Create frames for animation, at most max_frames of them (evenly sampled stops)
+    frame_stops = np.unique(np.linspace(0, len(data) - 1, min(len(data), max_frames)).astype(int))
+
+    # Animated traces, updated by the frames below. A frame replaces the data of the traces it
+    # names, so in incremental mode every frame draws its legs into a trace of its own and the
+    # legs of earlier frames stay on the map; cumulative mode redraws a single trace.
+    lons, lats = data['lon'].to_numpy(), data['lat'].to_numpy()
+    for k in range(1 if mode == "cumulative" else len(frame_stops)):
+        fig_2.add_trace(go.Scattermapbox(
+            lon=lons[:1] if k == 0 else [],
+            lat=lats[:1] if k == 0 else [],
+            mode='lines+markers',
+            marker=dict(size=15, color='red'),
+            line=dict(width=3, color='red'),
+            name='Moving',
+            legendgroup='moving',
+            showlegend=k == 0
+        ))
+
     frames = []
-    for i in range(len(data)):
+    previous = 0
+    for k, i in enumerate(frame_stops):
+        first = 0 if mode == "cumulative" else previous  # Plot points up to the current frame
         frames.append(go.Frame(
             data=[go.Scattermapbox(
-                lon=data['lon'][:i+1],  # Plot points up to the current frame
-                lat=data['lat'][:i+1],
-                mode='lines+markers',
-                marker=dict(size=15, color='red'),
-                line=dict(width=3, color='red'),
-                name='Moving'
+                lon=lons[first:i+1],
+                lat=lats[first:i+1],
             )],
-            name=f'frame{i}'
+            traces=[1 if mode == "cumulative" else 1 + k],
+            name=f'frame{k}'
         ))
+        previous = i
 
     # Add frames to the figure
     fig_2.frames = frames
@@ -279,6 +451,4 @@ def simulate_route(optimized_route, locations, speed=500):
                                         method="animate",
                                         args=[[None], {"frame": {"duration": 0, "redraw": False},
                                                        "mode": "immediate"}])])])
-
-    # Render the animated map figure in Streamlit
-    st.plotly_chart(fig_2)
+    return fig_2
@@ -0,0 +1,215 @@
+import hashlib
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from cost_matrix import matrix_source, open_matrix_source
+from profiling import count
+
+FITNESS_CACHE_SIZE = 200000  # Memoized chromosome distances kept per process
+TOURNAMENT_SIZE = 3
+MIGRANTS = 2  # Best chromosomes copied to the next island at each migration
+SEEDED_SHARE = 0.1  # Share of each island started from nearest neighbor tours instead of random ones
+SEEDING_CELLS = 50000000  # Matrix entries read for those tours at most, e.g. two tours of 5000 stops
+
+# Per-process state for pool workers, set once by _init_worker instead of pickled per task
+_worker_dist = None
+_worker_cache = {}
+
+
+# Distance of closed tours for every chromosome (row) of a population.
+# Chromosomes seen before are read from `cache`; the rest are evaluated in one vectorized pass.
+# Keys are fixed-size digests, so the cache stays small however long the chromosomes are.
+def evaluate_population(population, dist, cache):
+    keys = [hashlib.blake2b(row, digest_size=16).digest() for row in np.ascontiguousarray(population)]
+    distances = np.array([cache.get(key, -1.0) for key in keys])
+    missing = np.flatnonzero(distances < 0)
+    if len(missing):
+        tours = population[missing]
+        distances[missing] = dist[tours, np.roll(tours, -1, axis=1)].sum(axis=1, dtype=np.float64)
+        if len(cache) + len(missing) > FITNESS_CACHE_SIZE:
+            cache.clear()
+        for i in missing:
+            cache[keys[i]] = distances[i]
+    count("fitness_evaluations", len(missing))
+    count("fitness_cache_hits", len(keys) - len(missing))
+    return distances
+
+
+# Nearest neighbor tours over the matrix from each of the given starting stops, built side by side
+def nearest_neighbor_tours(dist, starts):
+    tours = np.empty((len(starts), len(dist)), dtype=np.int64)
+    visited = np.zeros(tours.shape, dtype=bool)
+    rows = np.arange(len(starts))
+    current = np.asarray(starts)
+    for step in range(len(dist)):
+        tours[:, step] = current
+        visited[rows, current] = True
+        if step < len(dist) - 1:
+            current = np.argmin(np.where(visited, np.inf, dist[current]), axis=1)
+    return tours
+
+
+# Ordered crossover: keep a slice of parent1 and fill the rest in parent2's order
+def ordered_crossover(parent1, parent2, rng):
+    size = len(parent1)
+    start, end = np.sort(rng.choice(size, 2, replace=False))
+    taken = np.zeros(size, dtype=bool)
+    taken[parent1[start:end]] = True
+    rest = parent2[~taken[parent2]]
+    return np.concatenate((rest[:start], parent1[start:end], rest[start:]))
+
+
+# Run a number of generations on one population; the best chromosome always survives
+def evolve(population, dist, cache, generations, mutation_rate, rng):
+    pop_size, size = population.shape
+    distances = evaluate_population(population, dist, cache)
+    for generation in range(generations):
+        # Tournament selection for every parent at once
+        entrants = rng.integers(0, pop_size, (pop_size, TOURNAMENT_SIZE))
+        parents = population[entrants[np.arange(pop_size), np.argmin(distances[entrants], axis=1)]]
+
+        children = np.empty_like(population)
+        for i in range(0, pop_size - 1, 2):
+            children[i] = ordered_crossover(parents[i], parents[i + 1], rng)
+            children[i + 1] = ordered_crossover(parents[i + 1], parents[i], rng)
+        if pop_size % 2:
+            children[-1] = parents[-1]
+
+        # Swap mutation
+        mutants = np.flatnonzero(rng.random(pop_size) < mutation_rate)
+        if len(mutants):
+            swaps = np.array([rng.choice(size, 2, replace=False) for _ in mutants])
+            children[mutants[:, None], swaps] = children[mutants[:, None], swaps[:, ::-1]]
+
+        children[0] = population[np.argmin(distances)]
+        population = children
+        distances = evaluate_population(population, dist, cache)
+    return population, distances
+
+
+# Chromosome as a closed route starting and ending at stop 0
+def closed_route(chromosome):
+    start = int(np.flatnonzero(chromosome == 0)[0])
+    return np.roll(chromosome, -start).tolist() + [0]
+
+
+# Memory-mapped matrices arrive as a file path and are reopened here rather than pickled
+def _init_worker(source):
+    global _worker_dist
+    _worker_dist = open_matrix_source(source)
+
+
+def _worker_evolve(population, generations, mutation_rate, seed):
+    return evolve(population, _worker_dist, _worker_cache, generations, mutation_rate, np.random.default_rng(seed))
+
+
+# Genetic Algorithm for route optimization with stopping criterion and timing
+def genetic_algorithm(dist_matrix, pop_size=100, num_generations=500, mutation_rate=0.01, convergence_generations=50,
+                      n_islands=1, migration_interval=25, workers=None, seed=None, time_budget=None,
+                      callback=None, stop=None, elite=None):
+    """
+    Evolves closed tours over a precomputed distance matrix.
+
+    The population is an (pop_size, n) integer array and fitness is the tour
+    length read from the matrix, memoized per chromosome. A SEEDED_SHARE of each
+    island starts as nearest neighbor tours from random stops, so even a short,
+    budgeted run returns a reasonable tour; the rest are random permutations.
+    With n_islands > 1 the
+    islands evolve independently for migration_interval generations at a time,
+    optionally in parallel on a ProcessPoolExecutor with `workers` processes, and
+    then pass their best chromosomes on to the next island.
+
+    Parameters:
+    dist_matrix (numpy array): Distance or cost matrix (int16, float32 or float64, may be
+    asymmetric or memory-mapped), e.g. from distance_matrix.distance_matrix.
+    pop_size (int, optional): Chromosomes per island.
+    num_generations (int, optional): Maximum generations per island.
+    mutation_rate (float, optional): Probability that a child gets a swap mutation.
+    convergence_generations (int, optional): Stop after this many generations without improvement.
+    n_islands (int, optional): Number of independently evolving populations.
+    migration_interval (int, optional): Generations between migrations.
+    workers (int, optional): Size of the process pool; islands run in-process when None.
+    seed (int, optional): Seed for reproducible runs.
+    time_budget (float, optional): Stop after this many seconds.
+    callback (callable, optional): Called as callback(route, distance) whenever the best route improves.
+    stop (threading.Event, optional): Ends the run after the current epoch once set.
+    elite (numpy array, optional): A (k, n) integer array of chromosomes, e.g. from
+    warm_start. Rows that are permutations of range(n) replace random chromosomes, spread over
+    the islands; on return the array holds the best k chromosomes of the final populations.
+
+    Returns:
+    tuple: The best route (starting and ending at stop 0), its distance and the
+    throughput in generations per second (summed over islands).
+    """
+    start_time = time.perf_counter()
+    dist = dist_matrix if isinstance(dist_matrix, np.ndarray) else np.asarray(dist_matrix)
+    n = len(dist)
+    if n < 3:
+        route = list(range(n)) + [0] if n else [0, 0]
+        return route, float(dist[route[:-1], route[1:]].sum(dtype=np.float64)) if n else 0.0, 0.0
+
+    seeds = np.random.SeedSequence(seed)
+    rng = np.random.default_rng(seeds.spawn(1)[0])
+    islands = [rng.permuted(np.tile(np.arange(n), (pop_size, 1)), axis=1) for _ in range(n_islands)]
+    n_seeded = min(max(int(pop_size * SEEDED_SHARE), 1), max(SEEDING_CELLS // (n * n * n_islands), 1), n)
+    for island in islands:
+        island[-n_seeded:] = nearest_neighbor_tours(dist, rng.choice(n, n_seeded, replace=False))
+    if elite is not None:
+        seeded = elite[(np.sort(elite, axis=1) == np.arange(n)).all(axis=1)]
+        for i in range(n_islands):
+            rows = seeded[i::n_islands][:pop_size]
+            islands[i][:len(rows)] = rows
+    interval = num_generations if n_islands == 1 else min(migration_interval, num_generations)
+    interval = min(interval, convergence_generations)
+
+    executor = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(matrix_source(dist),)) if workers else None
+    cache = {}
+    best_route, best_distance = None, float('inf')
+    generations = 0
+    generations_without_improvement = 0
+    try:
+        while generations < num_generations and generations_without_improvement < convergence_generations:
+            epoch = min(interval, num_generations - generations)
+            epoch_seeds = [s.generate_state(1)[0] for s in seeds.spawn(n_islands)]
+            if executor:
+                results = list(executor.map(_worker_evolve, islands, [epoch] * n_islands,
+                                            [mutation_rate] * n_islands, epoch_seeds))
+            else:
+                results = [evolve(island, dist, cache, epoch, mutation_rate, np.random.default_rng(s))
+                           for island, s in zip(islands, epoch_seeds)]
+            islands = [population for population, _ in results]
+            generations += epoch
+
+            improved = False
+            for population, distances in results:
+                best = int(np.argmin(distances))
+                if distances[best] < best_distance - 1e-9:
+                    best_distance = float(distances[best])
+                    best_route = population[best].copy()
+                    improved = True
+            generations_without_improvement = 0 if improved else generations_without_improvement + epoch
+            if improved and callback is not None:
+                callback(closed_route(best_route), best_distance)
+
+            # Ring migration: the best of each island replace the worst of the next
+            if n_islands > 1:
+                migrants = [population[np.argsort(distances)[:MIGRANTS]] for population, distances in results]
+                for i, (population, distances) in enumerate(results):
+                    population[np.argsort(distances)[-MIGRANTS:]] = migrants[i - 1]
+
+            count("ga_generations", epoch * n_islands)
+            if time_budget is not None and time.perf_counter() - start_time > time_budget:
+                break
+            if stop is not None and stop.is_set():
+                break
+    finally:
+        if executor:
+            executor.shutdown()
+
+    if elite is not None and generations:
+        final = np.concatenate([population for population, _ in results])
+        best = np.argsort(np.concatenate([distances for _, distances in results]), kind="stable")[:len(elite)]
+        elite[:len(best)] = final[best]
+
+    generations_per_second = generations * n_islands / max(time.perf_counter() - start_time, 1e-9)
+    return closed_route(best_route), best_distance, generations_per_second
@@ -0,0 +1,214 @@
+import time
+import numpy as np
+from distance_matrix import distance_matrix, nearest_neighbors
+from local_search import TourState, local_search, orient_path, IMPROVEMENT_OPERATORS, DEFAULT_NEIGHBORS, LOCKED
+from profiling import phase
+
+REPAIR_TIME_BUDGET = 0.05  # Seconds of local search after each change
+
+
+class IncrementalRoute:
+    """
+    A route that is being driven, updated in place as stops are added or cancelled.
+
+    Added stops get new indices (after the existing ones) and only their rows and
+    columns of the distance matrix and the affected neighbor lists are computed.
+    Each change is applied by cheapest insertion or removal followed by a local
+    search repair queued at the changed stops only. Stops already served, the
+    first `served` positions of the route, never move.
+
+    Parameters:
+    route (list): Closed route starting and ending at the depot, e.g. [0, 3, 1, 2, 0].
+    locations (array-like): An (n, 2) array of [latitude, longitude] coordinates.
+    dist_matrix (numpy array, optional): The haversine distance matrix of the locations; built when None.
+    served (int, optional): Number of route positions already visited (1: the vehicle is at the depot).
+    neighbors (int, optional): Length of each stop's candidate neighbor list.
+    time_budget (float, optional): Seconds of local search per change; None runs to a local optimum.
+    operators (tuple, optional): Names from IMPROVEMENT_OPERATORS used for the repair.
+    """
+
+    def __init__(self, route, locations, dist_matrix=None, served=1, neighbors=DEFAULT_NEIGHBORS,
+                 time_budget=REPAIR_TIME_BUDGET, operators=("2opt", "oropt")):
+        locations = np.asarray(locations, dtype=np.float64).reshape(-1, 2)
+        self.n = len(locations)
+        capacity = max(self.n, 16)
+        self._locations = np.empty((capacity, 2))
+        self._locations[:self.n] = locations
+        self._dist = np.empty((capacity, capacity))
+        self._dist[:self.n, :self.n] = distance_matrix(locations) if dist_matrix is None else dist_matrix
+
+        self.route = [int(c) for c in route]
+        self.served = max(1, served)
+        self.time_budget = time_budget
+        self.operators = [IMPROVEMENT_OPERATORS[op] for op in operators]
+        self.k = neighbors
+        self.active = np.zeros(capacity, dtype=bool)
+        self.active[self.route] = True
+
+        # Neighbor lists of every stop and the distance to the last (farthest) entry of each
+        self.neighbors = nearest_neighbors(None, neighbors, self.dist_matrix).tolist()
+        self.kth = np.full(capacity, np.inf)
+        for c, near in enumerate(self.neighbors):
+            if len(near) == neighbors:
+                self.kth[c] = self._dist[c, near[-1]]
+
+    @property
+    def locations(self):
+        return self._locations[:self.n]
+
+    @property
+    def dist_matrix(self):
+        return self._dist[:self.n, :self.n]
+
+    def length(self):
+        route = np.asarray(self.route)
+        return float(self._dist[route[:-1], route[1:]].sum())
+
+    # Mark the next `count` stops of the route as visited; they are fixed from now on
+    def serve(self, count=1):
+        self.served = min(self.served + count, len(self.route) - 1)
+
+    # Make room for `extra` more stops, doubling the buffers so growth is amortized
+    def _reserve(self, extra):
+        capacity = len(self._locations)
+        if self.n + extra <= capacity:
+            return
+        capacity = max(2 * capacity, self.n + extra)
+        n = self.n
+        locations, dist = np.empty((capacity, 2)), np.empty((capacity, capacity))
+        locations[:n], dist[:n, :n] = self._locations[:n], self._dist[:n, :n]
+        active, kth = np.zeros(capacity, dtype=bool), np.full(capacity, np.inf)
+        active[:n], kth[:n] = self.active[:n], self.kth[:n]
+        self._locations, self._dist, self.active, self.kth = locations, dist, active, kth
+
+    def add_stops(self, locations):
+        """
+        Adds stops to the unserved part of the route.
+
+        Parameters:
+        locations (array-like): An (m, 2) array of [latitude, longitude] coordinates.
+
+        Returns:
+        list: The indices given to the new stops.
+        """
+        new = np.asarray(locations, dtype=np.float64).reshape(-1, 2)
+        self._reserve(len(new))
+        ids = np.arange(self.n, self.n + len(new))
+        self._locations[ids] = new
+        self.n += len(new)
+        self.active[ids] = True
+
+        # Only the new rows (and, by symmetry, columns) of the distance matrix are computed
+        block = distance_matrix(self.locations, rows=ids)
+        block[np.arange(len(ids)), ids] = 0
+        self._dist[ids, :self.n] = block
+        self._dist[:self.n, ids] = block.T
+
+        block[np.arange(len(ids)), ids] = np.inf
+        block[:, ~self.active[:self.n]] = np.inf
+        for row, s in zip(block, ids.tolist()):
+            k = min(self.k, self.n - 1)
+            near = np.argpartition(row, k - 1)[:k] if k else ids[:0]
+            self.neighbors.append(near[np.argsort(row[near])].tolist())
+            self.kth[s] = row[self.neighbors[s][-1]] if k == self.k else np.inf
+            # Existing stops that have the new one closer than their current farthest neighbor
+            for c in np.flatnonzero(row < self.kth[:self.n]).tolist():
+                if c < s:  # Later new stops get their own lists from their rows
+                    self._add_neighbor(c, s, row[c])
+
+        touched = []
+        for s in ids.tolist():
+            touched += self._insert(s)
+        self._repair(touched)
+        return ids.tolist()
+
+    def _add_neighbor(self, c, s, d):
+        near = self.neighbors[c]
+        k = len(near)
+        while k and self._dist[c, near[k - 1]] > d:
+            k -= 1
+        near.insert(k, s)
+        del near[self.k:]
+        if len(near) == self.k:
+            self.kth[c] = self._dist[c, near[-1]]
+
+    # Cheapest insertion of stop s between two consecutive unserved positions
+    def _insert(self, s):
+        rest = np.asarray(self.route[self.served - 1:])
+        a, b = rest[:-1], rest[1:]
+        cost = self._dist[a, s] + self._dist[s, b] - self._dist[a, b]
+        k = int(np.argmin(cost))
+        self.route.insert(self.served + k, s)
+        return [int(a[k]), s, int(b[k])]
+
+    def remove_stops(self, stops):
+        """
+        Cancels stops that have not been served yet.
+
+        Parameters:
+        stops (iterable): Indices of the stops to remove from the route.
+        """
+        touched = []
+        for s in stops:
+            s = int(s)
+            try:
+                k = self.route.index(s, 1, len(self.route) - 1)
+            except ValueError:
+                raise ValueError(f"Stop {s} is not on the route") from None
+            if k < self.served:
+                raise ValueError(f"Stop {s} has already been served")
+            touched += [self.route[k - 1], self.route[k + 1]]
+            del self.route[k]
+            self.active[s] = False
+        self._repair([c for c in touched if self.active[c]])
+
+    # Local search on the unserved part of the route, starting from the touched stops.
+    # The part from the current stop back to the depot is closed into a cycle by a locked edge.
+    def _repair(self, touched):
+        current, depot = self.route[self.served - 1], self.route[-1]
+        rest = self.route[self.served - 1:]
+        if len(set(rest)) < 4:
+            return
+        start_time = time.perf_counter()
+        with phase("repair"):
+            state = TourState(rest, None, self.dist_matrix, self.neighbors, symmetric=True)
+            if current != depot:
+                dist = state.dist
+
+                def locked_dist(i, j):
+                    return LOCKED if (i == current and j == depot) or (i == depot and j == current) else dist(i, j)
+                state.dist = locked_dist
+            deadline = None if self.time_budget is None else start_time + self.time_budget
+            local_search(state, [c for c in touched if state.pos[c] >= 0], self.operators, deadline)
+
+            rest = state.route(current)
+            if current != depot:
+                rest = orient_path(rest, depot)  # The search may have reversed the direction of travel
+            self.route[self.served - 1:] = rest
+
+
+def reoptimize(route, locations, added=None, removed=(), served=1, dist_matrix=None, time_budget=REPAIR_TIME_BUDGET):
+    """
+    Applies one batch of added and cancelled stops to a route being driven.
+
+    For a steady stream of changes keep an IncrementalRoute instead, so the
+    distance matrix and neighbor lists are only extended, never rebuilt.
+
+    Parameters:
+    route (list): Closed route starting and ending at the depot.
+    locations (array-like): An (n, 2) array of [latitude, longitude] coordinates.
+    added (array-like, optional): An (m, 2) array of new stops; they get indices n to n + m - 1.
+    removed (iterable, optional): Indices of cancelled stops.
+    served (int, optional): Number of route positions already visited.
+    dist_matrix (numpy array, optional): The haversine distance matrix of the locations.
+    time_budget (float, optional): Seconds of local search per change.
+
+    Returns:
+    tuple: The new route, the (n + m, 2) locations and their distance matrix.
+    """
+    router = IncrementalRoute(route, locations, dist_matrix, served, time_budget=time_budget)
+    if len(removed):
+        router.remove_stops(removed)
+    if added is not None and len(added):
+        router.add_stops(added)
+    return router.route, router.locations.copy(), router.dist_matrix.copy()
@@ -0,0 +1,226 @@
+"""
+Compiled kernels for the scalar hot loops: haversine, route length, 2-opt move evaluation
+and the spanning trees of exact's lower bounds.
+
+Numba is optional. When it is installed the kernels are JIT-compiled on first use;
+otherwise (or with ROUTE_KERNELS=python) BACKEND is "python" and callers keep
+using the pure-Python reference implementations in functions.py and local_search.py.
+Run this file to check that both backends agree.
+"""
+import os
+import numpy as np
+from distance_matrix import R
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+BACKEND = "numba" if numba is not None and os.environ.get("ROUTE_KERNELS", "numba") != "python" else "python"
+EPSILON = 1e-9  # Same improvement threshold as local_search
+STEPS_PER_CALL = 4096  # Cities examined per two_opt_search call, so callers can check their deadline
+
+
+def _jit(function):
+    return numba.njit(cache=True, nogil=True)(function) if BACKEND == "numba" else function
+
+
+@_jit
+def haversine(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = np.radians(lat1), np.radians(lon1), np.radians(lat2), np.radians(lon2)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return R * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+# Length of a route read from a distance or cost matrix, summed in float64
+@_jit
+def route_length(route, dist):
+    total = 0.0
+    for k in range(len(route) - 1):
+        total += dist[route[k], route[k + 1]]
+    return total
+
+
+# Length of a route in km from [latitude, longitude] coordinates
+@_jit
+def route_length_coords(route, locations):
+    total = 0.0
+    for k in range(len(route) - 1):
+        i, j = route[k], route[k + 1]
+        total += haversine(locations[i, 0], locations[i, 1], locations[j, 0], locations[j, 1])
+    return total
+
+
+# Distance between stops i and j: from the matrix, or haversine on radians with precomputed cosines
+@_jit
+def _leg(i, j, dist, use_matrix, lats, lons, cos_lats):
+    if use_matrix:
+        return float(dist[i, j])
+    a = np.sin((lats[j] - lats[i]) / 2) ** 2 + cos_lats[i] * cos_lats[j] * np.sin((lons[j] - lons[i]) / 2) ** 2
+    return R * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+# Reverse the tour between positions i and j (inclusive, wrapping), flipping the shorter side
+@_jit
+def _reverse(tour, pos, i, j):
+    n = len(tour)
+    inner = (j - i) % n + 1
+    if inner * 2 > n:
+        i, j, inner = (j + 1) % n, (i - 1) % n, n - inner
+    for _ in range(inner // 2):
+        tour[i], tour[j] = tour[j], tour[i]
+        pos[tour[i]] = i
+        pos[tour[j]] = j
+        i, j = (i + 1) % n, (j - 1) % n
+
+
+@_jit
+def two_opt_search(tour, pos, dist, use_matrix, lats, lons, cos_lats, neighbors, queue, queued, head, size,
+                   max_steps=STEPS_PER_CALL):
+    """
+    2-opt with neighbor lists and don't-look bits on array state, moving exactly
+    like local_search.two_opt on a symmetric tour (first improvement, forward then
+    backward, neighbors sorted nearest first, -1 padded).
+
+    The queue is a ring buffer of len(tour) cities starting at `head` with `size`
+    entries; it is left in place between calls, so the search resumes where it stopped.
+
+    Returns:
+    tuple: The new head and size of the queue and the number of moves applied.
+    """
+    n = len(tour)
+    capacity = len(queue)
+    moves = 0
+    steps = 0
+    touched = np.empty(4, dtype=np.int64)
+    while size > 0 and steps < max_steps:
+        a = queue[head]
+        head = (head + 1) % capacity
+        size -= 1
+        queued[a] = False
+        steps += 1
+        for direction in range(2):
+            forward = direction == 0
+            pa = pos[a]
+            b = tour[(pa + 1) % n] if forward else tour[(pa - 1) % n]
+            d_ab = _leg(a, b, dist, use_matrix, lats, lons, cos_lats)
+            applied = False
+            for t in range(neighbors.shape[1]):
+                c = neighbors[a, t]
+                if c < 0:
+                    break
+                if pos[c] < 0:
+                    continue
+                d_ac = _leg(a, c, dist, use_matrix, lats, lons, cos_lats)
+                if d_ac >= d_ab:
+                    break
+                pc = pos[c]
+                d = tour[(pc + 1) % n] if forward else tour[(pc - 1) % n]
+                if c == b or d == a:
+                    continue
+                delta = (d_ac + _leg(b, d, dist, use_matrix, lats, lons, cos_lats) - d_ab
+                         - _leg(c, d, dist, use_matrix, lats, lons, cos_lats))
+                if delta < -EPSILON:
+                    if forward:
+                        _reverse(tour, pos, pos[b], pos[c])
+                    else:
+                        _reverse(tour, pos, pos[a], pos[d])
+                    touched[0], touched[1], touched[2], touched[3] = a, b, c, d
+                    for city in touched:
+                        if not queued[city]:
+                            queued[city] = True
+                            queue[(head + size) % capacity] = city
+                            size += 1
+                    moves += 1
+                    applied = True
+                    break
+            if applied:
+                break
+    return head, size, moves
+
+
+# Minimum spanning tree (Prim) over `nodes` with costs w[i, j] + pi[i] + pi[j]: its weight, each
+# node's degree and each node's parent (positions in `nodes`); same result as exact._spanning_tree
+@_jit
+def spanning_tree(w, pi, nodes):
+    k = len(nodes)
+    in_tree = np.zeros(k, dtype=np.bool_)
+    best = np.empty(k)
+    link = np.zeros(k, dtype=np.int64)
+    degree = np.zeros(k, dtype=np.int64)
+    for t in range(k):
+        best[t] = w[nodes[0], nodes[t]] + pi[nodes[0]] + pi[nodes[t]]
+    in_tree[0] = True
+    total = 0.0
+    for _ in range(k - 1):
+        j = -1
+        for t in range(k):
+            if not in_tree[t] and (j < 0 or best[t] < best[j]):
+                j = t
+        total += best[j]
+        degree[j] += 1
+        degree[link[j]] += 1
+        in_tree[j] = True
+        for t in range(k):
+            if not in_tree[t]:
+                cost = w[nodes[j], nodes[t]] + pi[nodes[j]] + pi[nodes[t]]
+                if cost < best[t]:
+                    best[t] = cost
+                    link[t] = j
+    return total, degree, link
+
+
+# Neighbor lists (possibly ragged) as an (n, k) array padded with -1
+def neighbor_array(neighbors):
+    k = max((len(near) for near in neighbors), default=0)
+    array = np.full((len(neighbors), k), -1, dtype=np.int64)
+    for c, near in enumerate(neighbors):
+        array[c, :len(near)] = near
+    return array
+
+
+def verify(n=300, seed=0):
+    """
+    Checks the compiled kernels against the pure-Python reference implementations
+    (functions.haversine, NumPy sums over the matrix, the 2-opt operator of
+    local_search and exact's spanning tree) on random London stops; raises
+    AssertionError on a mismatch.
+    """
+    from functions import haversine as reference_haversine, nearest_neighbor
+    from local_search import improve_route, TourState, compiled_two_opt
+    from distance_matrix import distance_matrix
+    from exact import _reference_spanning_tree
+
+    rng = np.random.default_rng(seed)
+    locations = rng.uniform([51.3, -0.2], [51.7, 0.2], (n, 2))
+    for p, q in rng.integers(0, n, (100, 2)):
+        expected = reference_haversine(*locations[p], *locations[q])
+        assert abs(haversine(*locations[p], *locations[q]) - expected) <= 1e-9 * max(expected, 1.0)
+
+    dist = distance_matrix(locations)
+    route = np.asarray(nearest_neighbor(locations, dist)[0])
+    # total_distance dispatches to these kernels, so the references are computed independently
+    for matrix in (dist, dist.astype(np.float32), np.rint(dist * 10).astype(np.int16)):
+        assert np.isclose(route_length(route, matrix), matrix[route[:-1], route[1:]].sum(dtype=np.float64))
+    expected = sum(reference_haversine(*locations[p], *locations[q]) for p, q in zip(route[:-1], route[1:]))
+    assert np.isclose(route_length_coords(route, locations), expected)
+
+    for matrix in (dist, None):
+        reference, _ = improve_route(route.tolist(), locations, matrix, operators=("2opt",), time_budget=None,
+                                     backend="python")
+        state = TourState(route.tolist(), locations, matrix, symmetric=True)
+        compiled_two_opt(state, locations, matrix)
+        assert state.route(0) == reference, "2-opt kernel and reference moved differently"
+
+    pi = rng.normal(0, 1, n)
+    nodes = rng.permutation(n)[:n // 2]
+    total, degree, link = spanning_tree(dist, pi, nodes)
+    expected, expected_degree, expected_link = _reference_spanning_tree(dist, pi, nodes)
+    assert np.isclose(total, expected) and (degree == expected_degree).all() and (link == expected_link).all(), \
+        "spanning tree kernel mismatch"
+    return True
+
+
+if __name__ == "__main__":
+    verify()
+    print(f"{BACKEND} kernels match the reference implementations")
@@ -0,0 +1,344 @@
+import time
+from collections import deque
+from math import sin, sqrt, atan2
+import numpy as np
+from distance_matrix import R, distance_matrix, nearest_neighbors
+from cost_matrix import is_symmetric
+from profiling import active_profiler, phase
+import kernels
+
+DEFAULT_NEIGHBORS = 8  # Candidate moves are only tried towards this many closest stops
+DEFAULT_TIME_BUDGET = 2.0  # Seconds
+OR_OPT_MAX_SEGMENT = 3
+PROGRESS_INTERVAL = 0.5  # Seconds between progress callbacks
+EPSILON = 1e-9
+# Cost given to the edge closing an open path into a cycle, so no move ever breaks it;
+# far below any real change in route length, but finite
+LOCKED = -1e7
+
+
+class TourState:
+    """
+    A cyclic tour with O(1) successor/predecessor lookups, shared by the improvement operators.
+
+    Parameters:
+    route (list): A route as returned by nearest_neighbor, e.g. [0, 3, 1, 2, 0].
+    locations (array-like): An (n, 2) array of [latitude, longitude] coordinates.
+    dist_matrix (numpy array, optional): Precomputed distances or costs; haversine is evaluated on demand otherwise.
+    neighbors (int or list, optional): Length of each stop's candidate neighbor list, or
+    precomputed lists (one per stop, nearest first) that are used as they are.
+    symmetric (bool, optional): Whether dist_matrix is symmetric; checked when None.
+    """
+
+    def __init__(self, route, locations, dist_matrix=None, neighbors=DEFAULT_NEIGHBORS, symmetric=None):
+        closed = len(route) > 1 and route[0] == route[-1]
+        self.tour = [int(c) for c in (route[:-1] if closed else route)]
+        self.n = len(self.tour)
+        size = len(locations) if dist_matrix is None else len(dist_matrix)
+        self.pos = [-1] * size
+        for i, c in enumerate(self.tour):
+            self.pos[c] = i
+
+        if dist_matrix is not None:
+            self.dist = dist_matrix.item
+            self.symmetric = is_symmetric(dist_matrix) if symmetric is None else symmetric
+        else:
+            rad = np.radians(np.asarray(locations, dtype=np.float64))
+            lats, lons = rad[:, 0].tolist(), rad[:, 1].tolist()
+            cos_lats = np.cos(rad[:, 0]).tolist()
+
+            def dist(i, j):
+                a = sin((lats[j] - lats[i]) / 2) ** 2 + cos_lats[i] * cos_lats[j] * sin((lons[j] - lons[i]) / 2) ** 2
+                return R * 2 * atan2(sqrt(a), sqrt(1 - a))
+            self.dist = dist
+            self.symmetric = True
+        if isinstance(neighbors, (int, np.integer)):
+            neighbors = nearest_neighbors(locations, neighbors, dist_matrix).tolist()
+        self.neighbors = neighbors
+
+    def succ(self, c):
+        return self.tour[(self.pos[c] + 1) % self.n]
+
+    def pred(self, c):
+        return self.tour[self.pos[c] - 1]
+
+    def length(self):
+        return sum(self.dist(self.tour[i - 1], self.tour[i]) for i in range(self.n))
+
+    # Reverse the tour between positions i and j (inclusive, going forward, wrapping around).
+    # Reversing the complementary path gives the same cycle, so the shorter one is flipped.
+    def reverse(self, i, j):
+        n = self.n
+        inner = (j - i) % n + 1
+        if inner * 2 > n:
+            i, j, inner = (j + 1) % n, (i - 1) % n, n - inner
+        tour, pos = self.tour, self.pos
+        for _ in range(inner // 2):
+            tour[i], tour[j] = tour[j], tour[i]
+            pos[tour[i]], pos[tour[j]] = i, j
+            i, j = (i + 1) % n, (j - 1) % n
+
+    # Move `segment` (consecutive stops, in tour order) to sit between u and its successor
+    def move_segment(self, segment, u, reverse=False):
+        n = len(segment)
+        after = self.succ(segment[-1])
+        start = self.pos[after]
+        rest = [self.tour[(start + t) % self.n] for t in range(self.n - n)]
+        k = (self.pos[u] - start) % self.n + 1
+        self.tour = rest[:k] + (segment[::-1] if reverse else segment) + rest[k:]
+        for i, c in enumerate(self.tour):
+            self.pos[c] = i
+
+    # Closed route starting and ending at `start`, in the format nearest_neighbor returns
+    def route(self, start):
+        k = self.pos[start]
+        return self.tour[k:] + self.tour[:k] + [start]
+
+
+# 2-opt: replace edges (a, b) and (c, d) by (a, c) and (b, d), trying both tour directions from a.
+# Reversing a section changes its cost on asymmetric matrices, so it is skipped there.
+def two_opt(state, a):
+    if not state.symmetric:
+        return None
+    dist = state.dist
+    for forward in (True, False):
+        b = state.succ(a) if forward else state.pred(a)
+        d_ab = dist(a, b)
+        for c in state.neighbors[a]:
+            if state.pos[c] < 0:
+                continue
+            d_ac = dist(a, c)
+            if d_ac >= d_ab:
+                break  # Neighbor lists are sorted, no closer candidates remain
+            d = state.succ(c) if forward else state.pred(c)
+            if c == b or d == a:
+                continue
+            delta = d_ac + dist(b, d) - d_ab - dist(c, d)
+            if delta < -EPSILON:
+                if forward:
+                    state.reverse(state.pos[b], state.pos[c])
+                else:
+                    state.reverse(state.pos[a], state.pos[d])
+                return a, b, c, d
+    return None
+
+
+# Or-opt: move a run of up to OR_OPT_MAX_SEGMENT stops starting at a next to one of its neighbors
+def or_opt(state, a):
+    dist = state.dist
+    for length in range(1, OR_OPT_MAX_SEGMENT + 1):
+        if state.n < length + 3:
+            break
+        segment = [state.tour[(state.pos[a] + t) % state.n] for t in range(length)]
+        first, last = segment[0], segment[-1]
+        p, nx = state.pred(first), state.succ(last)
+        gain = dist(p, first) + dist(last, nx) - dist(p, nx)
+        if gain <= EPSILON:
+            continue
+        for c in state.neighbors[first] + state.neighbors[last]:
+            if state.pos[c] < 0 or c in segment:
+                continue
+            for u, v in ((c, state.succ(c)), (state.pred(c), c)):
+                if u in segment or v in segment:
+                    continue
+                d_uv = dist(u, v)
+                if dist(u, first) + dist(last, v) - d_uv - gain < -EPSILON:
+                    state.move_segment(segment, u)
+                    return p, nx, u, v, first, last
+                if state.symmetric and dist(u, last) + dist(first, v) - d_uv - gain < -EPSILON:
+                    state.move_segment(segment, u, reverse=True)
+                    return p, nx, u, v, first, last
+    return None
+
+
+# Registered improvement operators; each takes (state, city), applies the first improving
+# move it finds around that city and returns the cities whose edges changed, or None
+IMPROVEMENT_OPERATORS = {
+    "2opt": two_opt,
+    "oropt": or_opt,
+}
+
+
+def local_search(state, cities, operators, deadline=None, stop=None, callback=None):
+    """
+    Applies improving moves to a TourState in place until no queued city yields one.
+
+    Starts with the don't-look bits of `cities` off; every city whose edges a move
+    changes is queued again.
+
+    Parameters:
+    state (TourState): The tour to improve.
+    cities (iterable): Cities examined first (all tour cities for a full pass).
+    operators (list): Operator callables, tried in order for each city.
+    deadline (float, optional): time.perf_counter() value after which the search stops.
+    stop (threading.Event, optional): The search stops once this is set.
+    callback (callable, optional): Called with the state every PROGRESS_INTERVAL seconds.
+
+    Returns:
+    tuple: Moves tried and moves accepted, per operator.
+    """
+    tried = [0] * len(operators)
+    accepted = [0] * len(operators)
+
+    # Cities in the queue have their don't-look bit off
+    queue = deque()
+    queued = [False] * len(state.pos)
+    for c in cities:
+        if not queued[c]:
+            queued[c] = True
+            queue.append(c)
+
+    next_progress = time.perf_counter() + PROGRESS_INTERVAL
+    while queue:
+        if deadline is not None or callback is not None:
+            now = time.perf_counter()
+            if deadline is not None and now > deadline:
+                break
+            if callback is not None and now > next_progress:
+                callback(state)
+                next_progress = now + PROGRESS_INTERVAL
+        if stop is not None and stop.is_set():
+            break
+        a = queue.popleft()
+        queued[a] = False
+        for k, operator in enumerate(operators):
+            tried[k] += 1
+            touched = operator(state, a)
+            if touched:
+                accepted[k] += 1
+                for c in touched:
+                    if not queued[c]:
+                        queued[c] = True
+                        queue.append(c)
+                break
+    return tried, accepted
+
+
+# Run the compiled 2-opt kernel on a symmetric TourState until no 2-opt move is left
+# (or the deadline passes); returns the number of moves applied
+def compiled_two_opt(state, locations, dist_matrix=None, deadline=None, stop=None):
+    tour = np.array(state.tour, dtype=np.int64)
+    pos = np.array(state.pos, dtype=np.int64)
+    if dist_matrix is not None:
+        dist, use_matrix = np.asarray(dist_matrix), True
+        lats = lons = cos_lats = np.empty(0)
+    else:
+        rad = np.radians(np.asarray(locations, dtype=np.float64))
+        dist, use_matrix = np.empty((1, 1)), False
+        lats, lons, cos_lats = rad[:, 0].copy(), rad[:, 1].copy(), np.cos(rad[:, 0])
+    neighbors = kernels.neighbor_array(state.neighbors)
+    queue = tour.copy()
+    queued = np.zeros(len(pos), dtype=bool)
+    queued[tour] = True
+    head, size, moves = 0, len(tour), 0
+    while size:
+        head, size, applied = kernels.two_opt_search(tour, pos, dist, use_matrix, lats, lons, cos_lats,
+                                                     neighbors, queue, queued, head, size)
+        moves += applied
+        if deadline is not None and time.perf_counter() > deadline or stop is not None and stop.is_set():
+            break
+    state.tour, state.pos = tour.tolist(), pos.tolist()
+    return moves
+
+
+def improve_route(route, locations, dist_matrix=None, operators=("2opt", "oropt"),
+                  time_budget=DEFAULT_TIME_BUDGET, neighbors=DEFAULT_NEIGHBORS, symmetric=None, callback=None, stop=None,
+                  backend=None):
+    """
+    Improves a route (e.g. from nearest_neighbor) with local search.
+
+    Uses neighbor lists and don't-look bits: only cities whose edges changed are
+    re-examined, which keeps each pass close to linear in the number of stops.
+
+    Parameters:
+    route (list): A closed route such as [0, 3, 1, 2, 0].
+    locations (array-like): An (n, 2) array of [latitude, longitude] coordinates.
+    dist_matrix (numpy array, optional): Precomputed distance or cost matrix (locations may then be None).
+    On asymmetric matrices only moves that keep segment directions are used.
+    operators (tuple, optional): Names from IMPROVEMENT_OPERATORS or operator callables.
+    time_budget (float, optional): Stop after this many seconds; None runs to a local optimum.
+    neighbors (int, optional): Number of candidate neighbors per stop.
+    symmetric (bool, optional): Whether dist_matrix is symmetric; checked when None.
+    callback (callable, optional): Called as callback(route, distance) with the current route
+    every PROGRESS_INTERVAL seconds.
+    stop (threading.Event, optional): Ends the search early once set.
+    backend (str, optional): "numba" runs 2-opt in the compiled kernel before the Python
+    operators, "python" uses the reference operators only; kernels.BACKEND when None.
+
+    Returns:
+    tuple: The improved route (same start stop) and the distance saved in km.
+    """
+    start_time = time.perf_counter()
+    with phase("neighbor_lists"):
+        state = TourState(route, locations, dist_matrix, neighbors, symmetric)
+    if state.n < 4:
+        return list(route), 0.0
+    names = [getattr(op, "__name__", "operator") if callable(op) else op for op in operators]
+    operators = [op if callable(op) else IMPROVEMENT_OPERATORS[op] for op in operators]
+    initial_distance = state.length()
+
+    # Distance lookups are only counted while profiling, the wrapper costs a call per lookup
+    profiler = active_profiler()
+    if profiler is not None:
+        evaluations = [0]
+        dist = state.dist
+
+        def counted_dist(i, j):
+            evaluations[0] += 1
+            return dist(i, j)
+        state.dist = counted_dist
+    deadline = None if time_budget is None else start_time + time_budget
+    progress = None if callback is None else lambda s: callback(s.route(route[0]), s.length())
+    if (backend or kernels.BACKEND) == "numba" and state.symmetric and two_opt in operators:
+        with phase("two_opt_kernel"):
+            moves = compiled_two_opt(state, locations, dist_matrix, deadline, stop)
+        if profiler is not None:
+            profiler.count("moves_accepted.2opt_kernel", moves)
+    tried, accepted = local_search(state, state.tour, operators, deadline, stop, progress)
+
+    if profiler is not None:
+        state.dist = dist
+        profiler.count("distance_evaluations", evaluations[0])
+        for name, k_tried, k_accepted in zip(names, tried, accepted):
+            profiler.count(f"moves_tried.{name}", k_tried)
+            profiler.count(f"moves_accepted.{name}", k_accepted)
+    return state.route(route[0]), float(initial_distance - state.length())
+
+
+# Cycle from the first stop of an open path, oriented so that it ends with the path's last stop
+def orient_path(cycle, last):
+    cycle = cycle[:-1] if len(cycle) > 1 and cycle[0] == cycle[-1] else cycle
+    if len(cycle) > 2 and cycle[1] == last:
+        cycle = cycle[:1] + cycle[:0:-1]
+    return cycle
+
+
+def improve_path(path, locations, dist_matrix=None, time_budget=DEFAULT_TIME_BUDGET, neighbors=DEFAULT_NEIGHBORS,
+                 backend=None):
+    """
+    Improves an open path whose first and last stops stay in place, e.g. one window of a longer tour.
+
+    The path is closed into a cycle by a LOCKED edge between its endpoints and
+    improved with improve_route on its own small distance matrix.
+
+    Parameters:
+    path (list): Stop indices in visiting order.
+    locations (array-like): An (n, 2) array of [latitude, longitude] coordinates.
+    dist_matrix (numpy array, optional): Symmetric distance matrix over all stops; the path's
+    block is copied out of it, haversine distances are used otherwise.
+    time_budget (float, optional): Stop after this many seconds; None runs to a local optimum.
+
+    Returns:
+    list: The improved path, same endpoints.
+    """
+    path = np.asarray(path, dtype=np.intp)
+    if len(path) < 4:
+        return path.tolist()
+    if dist_matrix is None:
+        sub = distance_matrix(np.asarray(locations)[path])
+    else:
+        sub = np.array(dist_matrix[np.ix_(path, path)], dtype=np.float64)
+    sub[0, -1] = sub[-1, 0] = LOCKED
+    cycle, _ = improve_route(list(range(len(path))), None, sub, time_budget=time_budget,
+                             neighbors=min(neighbors, len(path) - 1), symmetric=True, backend=backend)
+    return path[orient_path(cycle, len(path) - 1)].tolist()
@@ -0,0 +1,110 @@
+import os
+from collections import namedtuple
+import numpy as np
+
+LAT_COLUMN = "latitude"
+LON_COLUMN = "longitude"
+DEFAULT_CHUNK_ROWS = 65536  # Rows parsed per chunk; only one chunk of DataFrame is alive at a time
+
+# Result of reading a manifest: the (n, 2) float64 coordinates, the manifest row each one came
+# from, and how many rows were dropped as invalid or as duplicates of an earlier stop
+Manifest = namedtuple("Manifest", "locations rows invalid duplicates")
+
+
+# Chunks of (lat, lon) float64 arrays from a CSV or Parquet file (a path or an open file object)
+def iter_coordinate_chunks(source, lat_column=LAT_COLUMN, lon_column=LON_COLUMN, chunk_rows=DEFAULT_CHUNK_ROWS,
+                           file_format=None):
+    if file_format is None:
+        name = source if isinstance(source, (str, os.PathLike)) else getattr(source, "name", "")
+        file_format = "parquet" if str(name).endswith(".parquet") else "csv"
+    if file_format == "parquet":
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(source).iter_batches(batch_size=chunk_rows, columns=[lat_column, lon_column]):
+            yield (batch.column(lat_column).to_numpy(zero_copy_only=False).astype(np.float64, copy=False),
+                   batch.column(lon_column).to_numpy(zero_copy_only=False).astype(np.float64, copy=False))
+    elif file_format == "csv":
+        import pandas as pd
+
+        reader = pd.read_csv(source, usecols=[lat_column, lon_column], chunksize=chunk_rows,
+                             dtype={lat_column: np.float64, lon_column: np.float64})
+        with reader:
+            for chunk in reader:
+                yield chunk[lat_column].to_numpy(np.float64), chunk[lon_column].to_numpy(np.float64)
+    else:
+        raise ValueError(f"Unknown manifest format: {file_format}")
+
+
+# Mask of rows that are finite and within latitude/longitude range
+def valid_coordinates(lats, lons):
+    return np.isfinite(lats) & np.isfinite(lons) & (np.abs(lats) <= 90) & (np.abs(lons) <= 180)
+
+
+# Indices of the first occurrence of every distinct row of an (n, 2) array, in their original order
+def first_unique(points):
+    if len(points) == 0:
+        return np.arange(0)
+    keys = np.ascontiguousarray(points).view(np.dtype((np.void, points.dtype.itemsize * 2))).ravel()
+    _, first = np.unique(keys, return_index=True)
+    return np.sort(first)
+
+
+def read_manifest(source, lat_column=LAT_COLUMN, lon_column=LON_COLUMN, chunk_rows=DEFAULT_CHUNK_ROWS,
+                  dedupe=True, on_invalid="drop", file_format=None):
+    """
+    Streams the stops of a delivery manifest into a contiguous (n, 2) float64 array.
+
+    The file is parsed chunk_rows at a time and each chunk is validated and
+    copied into a growing coordinate buffer with array operations only, so
+    peak memory is the coordinates plus one chunk rather than a whole DataFrame.
+
+    Parameters:
+    source (str or file object): A CSV or Parquet file with one stop per row; the first row is the depot.
+    lat_column, lon_column (str, optional): Names of the coordinate columns.
+    chunk_rows (int, optional): Rows parsed per chunk.
+    dedupe (bool, optional): Keep only the first row of every repeated coordinate pair.
+    on_invalid (str, optional): "drop" skips missing or out-of-range coordinates, "raise" rejects the file.
+    Either way a file without a single valid stop raises ValueError.
+    file_format (str, optional): "csv" or "parquet"; inferred from the file name when None.
+
+    Returns:
+    Manifest: The coordinates, their manifest row numbers and the invalid and duplicate row counts.
+    """
+    if on_invalid not in ("drop", "raise"):
+        raise ValueError(f"on_invalid must be 'drop' or 'raise', got {on_invalid!r}")
+    locations = np.empty((chunk_rows, 2), dtype=np.float64)
+    rows = np.empty(chunk_rows, dtype=np.int64)
+    size = 0
+    offset = 0
+    invalid = 0
+    for lats, lons in iter_coordinate_chunks(source, lat_column, lon_column, chunk_rows, file_format):
+        valid = valid_coordinates(lats, lons)
+        keep = np.flatnonzero(valid)
+        if len(keep) < len(lats):
+            if on_invalid == "raise":
+                bad = offset + int(np.flatnonzero(~valid)[0])
+                raise ValueError(f"Manifest row {bad} has a missing or out-of-range coordinate")
+            invalid += len(lats) - len(keep)
+        points = np.column_stack((lats[keep], lons[keep])) + 0.0  # -0.0 and 0.0 are the same stop when deduplicating
+        if dedupe:
+            first = first_unique(points)  # Duplicates within a chunk never reach the buffer
+            points, keep = points[first], keep[first]
+
+        if size + len(points) > len(locations):
+            capacity = max(2 * len(locations), size + len(points))
+            locations = np.resize(locations, (capacity, 2))
+            rows = np.resize(rows, capacity)
+        locations[size:size + len(points)] = points
+        rows[size:size + len(points)] = offset + keep
+        size += len(points)
+        offset += len(lats)
+
+    if size == 0:
+        raise ValueError(f"Manifest has no valid stops ({offset} rows, {invalid} invalid)")
+    locations, rows = locations[:size], rows[:size]
+    duplicates = 0
+    if dedupe:
+        first = first_unique(locations)
+        duplicates = offset - invalid - len(first)
+        locations, rows = locations[first], rows[first]
+    return Manifest(np.ascontiguousarray(locations), rows.copy(), invalid, duplicates)
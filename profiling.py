@@ -0,0 +1,90 @@
+import json
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+# Profiler collecting for the current thread (each Streamlit session runs in its own), or None
+_active = ContextVar("active_profiler", default=None)
+
+
+class Profiler:
+    """
+    Per-phase timers on perf_counter_ns and named counters for one solve.
+
+    Solver code reports through the module-level phase() and count() helpers,
+    which do nothing unless a profiler is active (see profile()), so the hot
+    paths only pay for instrumentation when someone is collecting it.
+
+    Parameters:
+    callback (callable, optional): Called as callback(name, elapsed_ns) whenever a phase ends.
+    """
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.phases = {}  # name -> [calls, total ns]
+        self.counters = {}
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter_ns() - start
+            calls_total = self.phases.setdefault(name, [0, 0])
+            calls_total[0] += 1
+            calls_total[1] += elapsed
+            if self.callback is not None:
+                self.callback(name, elapsed)
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    # Add another profiler's phases and counters to this one
+    def merge(self, other):
+        for name, (calls, total) in other.phases.items():
+            calls_total = self.phases.setdefault(name, [0, 0])
+            calls_total[0] += calls
+            calls_total[1] += total
+        for name, n in other.counters.items():
+            self.count(name, n)
+        return self
+
+    def seconds(self, name):
+        return self.phases.get(name, (0, 0))[1] / 1e9
+
+    def to_dict(self):
+        return {
+            "phases": {name: {"calls": calls, "total_ns": total} for name, (calls, total) in self.phases.items()},
+            "counters": dict(self.counters),
+        }
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.to_dict(), **kwargs)
+
+
+def active_profiler():
+    return _active.get()
+
+
+# Collect every phase() and count() made inside the block, in this thread, into a profiler
+@contextmanager
+def profile(profiler=None, callback=None):
+    profiler = Profiler(callback) if profiler is None else profiler
+    token = _active.set(profiler)
+    try:
+        yield profiler
+    finally:
+        _active.reset(token)
+
+
+# Time a block as the named phase of the active profiler, if any
+def phase(name):
+    profiler = _active.get()
+    return nullcontext() if profiler is None else profiler.phase(name)
+
+
+def count(name, n=1):
+    profiler = _active.get()
+    if profiler is not None:
+        profiler.count(name, n)
@@ -0,0 +1,464 @@
+"""
+Long-running routing service: one process solving routes for many dispatchers over HTTP.
+
+Requests are handled on an asyncio event loop and solved on a shared process pool.
+Identical requests share one solve and its cached result. Distance matrices are
+built once per distinct location set into shared memory and pool workers attach
+to them by name, so a matrix is never pickled per task or duplicated per session.
+Small requests are micro-batched into a few pool tasks.
+
+Endpoints:
+    POST /solve   {"locations": [[lat, lon], ...], "algorithm": "aco", "vehicles": 1,
+                   "improve": true, "time_budget": 5.0, "seed": null}
+                  -> {"routes", "distances", "saved_km", "proven", "lower_bounds", "gaps"}
+    GET  /stats   Request, cache, batch and shared matrix counters
+    GET  /health
+
+Example:
+    python routing_service.py --port 8765 --workers 8
+    ROUTING_SERVICE_URL=http://127.0.0.1:8765 streamlit run app.py
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sys
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+from distance_matrix import distance_matrix
+from exact import route_bounds
+from local_search import DEFAULT_TIME_BUDGET
+from solve_cache import SolveCache, fingerprint
+from solver import check_algorithm, needs_matrix, solve_locations
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+BATCH_MAX_STOPS = 100  # Requests up to this size are micro-batched
+BATCH_SIZE = 64  # Requests collected before a batch is dispatched early
+BATCH_WINDOW = 0.005  # Seconds a small request waits for others to batch with
+MATRIX_MEMORY_MB = 2048  # Shared-memory matrices kept for reuse; matrices in use are never evicted
+RESULT_CACHE_SIZE = 1024
+WORKER_ATTACHED = 8  # Shared matrices each worker keeps mapped
+MAX_BODY_BYTES = 64 * 2 ** 20
+
+# Shared-memory matrices mapped into this worker process: name -> (SharedMemory, matrix)
+_attached = OrderedDict()
+
+
+# Open an existing shared-memory block; the service process owns and unlinks every block.
+# Before Python 3.13 (no track=) workers register it with the service's resource tracker, which is harmless.
+def _open_shared(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+# The n x n float64 matrix in the named shared-memory block, mapped once per worker
+def _attach(name, n):
+    if name in _attached:
+        _attached.move_to_end(name)
+        return _attached[name][1]
+    shm = _open_shared(name)
+    matrix = np.ndarray((n, n), dtype=np.float64, buffer=shm.buf)
+    _attached[name] = (shm, matrix)
+    while len(_attached) > WORKER_ATTACHED:
+        old, old_matrix = _attached.popitem(last=False)[1]
+        del old_matrix
+        try:
+            old.close()
+        except BufferError:  # Still referenced by a solve result; unmapped when collected
+            pass
+    return matrix
+
+
+def _build_matrix(name, locations):
+    distance_matrix(locations, out=_attach(name, len(locations)))
+
+
+# Solve one request in a pool worker; the matrix, if any, is read from shared memory
+def _solve(locations, params, matrix_name=None):
+    dist_matrix = None if matrix_name is None else _attach(matrix_name, len(locations))
+    routes, distances, saved_km, proven = solve_locations(
+        locations, params["algorithm"], params["vehicles"], params["improve"], params["time_budget"],
+        dist_matrix, params["seed"], workers=1)
+    bounds, gaps = route_bounds(routes, distances, locations, dist_matrix)
+    return {
+        "routes": [[int(stop) for stop in route] for route in routes],
+        "distances": [float(d) for d in distances],
+        "saved_km": float(saved_km),
+        "proven": bool(proven),
+        "lower_bounds": bounds,
+        "gaps": gaps,
+    }
+
+
+# Solve a micro-batch of small requests in one task; failures are reported per request
+def _solve_batch(requests):
+    results = []
+    for locations, params in requests:
+        try:
+            results.append((_solve(locations, params), None))
+        except Exception as e:
+            results.append((None, f"{type(e).__name__}: {e}"))
+    return results
+
+
+class SharedMatrix:
+    def __init__(self, shm, n, build):
+        self.shm = shm
+        self.n = n
+        self.build = build  # Future of the pool task filling the block
+        self.users = 0
+
+
+class MatrixStore:
+    """
+    Distance matrices in shared memory, keyed by a fingerprint of the locations.
+
+    The first request for a location set creates the block and has a pool worker
+    fill it; concurrent requests for the same set wait for that build. Unused
+    matrices are kept for reuse, least recently used first out, within a memory limit.
+
+    Parameters:
+    executor (ProcessPoolExecutor): Pool the matrices are built on.
+    limit_mb (float, optional): Memory kept for matrices no request is using.
+    """
+
+    def __init__(self, executor, limit_mb=MATRIX_MEMORY_MB):
+        self.executor = executor
+        self.limit = int(limit_mb * 2 ** 20)
+        self.entries = OrderedDict()
+        self.builds = 0
+
+    def nbytes(self):
+        return sum(entry.shm.size for entry in self.entries.values())
+
+    # Name of the shared-memory block holding the matrix, built if needed; pair with release()
+    async def acquire(self, key, locations):
+        entry = self.entries.get(key)
+        if entry is None:
+            n = len(locations)
+            shm = shared_memory.SharedMemory(create=True, size=max(n * n * 8, 1))
+            build = asyncio.get_running_loop().run_in_executor(self.executor, _build_matrix, shm.name, locations)
+            entry = self.entries[key] = SharedMatrix(shm, n, build)
+            self.builds += 1
+        self.entries.move_to_end(key)
+        entry.users += 1
+        try:
+            await asyncio.shield(entry.build)
+        except BaseException:
+            self.release(key)
+            raise
+        return entry.shm.name
+
+    def release(self, key):
+        entry = self.entries[key]
+        entry.users -= 1
+        if entry.users == 0 and entry.build.done() and (entry.build.cancelled() or entry.build.exception()):
+            self._drop(key)  # A failed build is never reused
+        self._evict()
+
+    def _evict(self):
+        excess = self.nbytes() - self.limit
+        for key in [key for key, entry in self.entries.items() if entry.users == 0 and entry.build.done()]:
+            if excess <= 0:
+                break
+            excess -= self.entries[key].shm.size
+            self._drop(key)
+
+    def _drop(self, key):
+        entry = self.entries.pop(key)
+        entry.shm.close()
+        entry.shm.unlink()
+
+    def close(self):
+        for key in list(self.entries):
+            self._drop(key)
+
+
+# Validate a /solve request body into locations and solve parameters; raises ValueError
+def parse_request(payload):
+    if not isinstance(payload, dict):
+        raise ValueError("Request body must be a JSON object")
+    try:
+        locations = np.asarray(payload["locations"], dtype=np.float64)
+    except KeyError:
+        raise ValueError("Missing 'locations'") from None
+    except (TypeError, ValueError):
+        raise ValueError("'locations' must be a list of [latitude, longitude] pairs") from None
+    if locations.ndim != 2 or locations.shape[1] != 2 or len(locations) < 2:
+        raise ValueError("'locations' must be a list of at least two [latitude, longitude] pairs")
+    if not np.isfinite(locations).all():
+        raise ValueError("'locations' must be finite numbers")
+    params = {
+        "algorithm": payload.get("algorithm", "nearest_neighbor"),
+        "vehicles": payload.get("vehicles", 1),
+        "improve": payload.get("improve", True),
+        "time_budget": payload.get("time_budget", DEFAULT_TIME_BUDGET),
+        "seed": payload.get("seed"),
+    }
+    if not isinstance(params["vehicles"], int) or params["vehicles"] < 1:
+        raise ValueError("'vehicles' must be a positive integer")
+    check_algorithm(params["algorithm"], len(locations) if params["vehicles"] == 1 else 0)
+    if not isinstance(params["improve"], bool):
+        raise ValueError("'improve' must be true or false")
+    if params["time_budget"] is not None and not isinstance(params["time_budget"], (int, float)):
+        raise ValueError("'time_budget' must be a number of seconds or null")
+    if params["seed"] is not None and not isinstance(params["seed"], int):
+        raise ValueError("'seed' must be an integer or null")
+    return locations, params
+
+
+class RoutingService:
+    """
+    Solves routing requests on a process pool shared by every client.
+
+    Parameters:
+    workers (int, optional): Pool size; None uses one process per CPU.
+    cache_size (int, optional): Solve results kept in memory.
+    cache_dir (str, optional): If given, solve results are also kept on disk (see SolveCache).
+    matrix_memory_mb (float, optional): Memory kept for shared distance matrices not in use.
+    """
+
+    def __init__(self, workers=None, cache_size=RESULT_CACHE_SIZE, cache_dir=None, matrix_memory_mb=MATRIX_MEMORY_MB):
+        # Started before the pool so workers share it; a worker with its own tracker would unlink on exit
+        resource_tracker.ensure_running()
+        self.executor = ProcessPoolExecutor(workers)
+        self.workers = workers or os.cpu_count() or 1
+        self.matrices = MatrixStore(self.executor, matrix_memory_mb)
+        self.results = SolveCache(maxsize=cache_size, directory=cache_dir)
+        self.pending = {}  # key -> task of an in-flight solve, shared by identical requests
+        self.batch = []  # (locations, params, future) of small requests waiting to be dispatched
+        self.batch_timer = None
+        self.counters = {"requests": 0, "solves": 0, "joined": 0, "batches": 0, "batched_requests": 0, "errors": 0}
+
+    async def solve(self, locations, params):
+        """
+        Routes one request, reusing a cached result or an identical solve already running.
+
+        Returns:
+        dict: The result key, per-vehicle routes and distances in km and the km saved by local search.
+        """
+        self.counters["requests"] += 1
+        key = fingerprint(locations, **params)
+        result = self.results.get(key)
+        if result is None:
+            task = self.pending.get(key)
+            if task is None:
+                task = self.pending[key] = asyncio.ensure_future(self._compute(key, locations, params))
+            else:
+                self.counters["joined"] += 1
+            result = await asyncio.shield(task)
+        return {"key": key, **result}
+
+    async def _compute(self, key, locations, params):
+        self.counters["solves"] += 1
+        loop = asyncio.get_running_loop()
+        try:
+            if len(locations) <= BATCH_MAX_STOPS:
+                result = await self._batched(locations, params)
+            elif params["vehicles"] == 1 and needs_matrix(params["algorithm"], len(locations)):
+                matrix_key = fingerprint(locations)
+                name = await self.matrices.acquire(matrix_key, locations)
+                try:
+                    result = await loop.run_in_executor(self.executor, _solve, locations, params, name)
+                finally:
+                    self.matrices.release(matrix_key)
+            else:
+                result = await loop.run_in_executor(self.executor, _solve, locations, params)
+            self.results.put(key, result)
+            return result
+        finally:
+            del self.pending[key]
+
+    def _batched(self, locations, params):
+        future = asyncio.get_running_loop().create_future()
+        self.batch.append((locations, params, future))
+        if len(self.batch) >= BATCH_SIZE:
+            self._flush()
+        elif self.batch_timer is None:
+            self.batch_timer = asyncio.get_running_loop().call_later(BATCH_WINDOW, self._flush)
+        return future
+
+    # Dispatch the waiting small requests, split into at most one task per worker
+    def _flush(self):
+        if self.batch_timer is not None:
+            self.batch_timer.cancel()
+            self.batch_timer = None
+        batch, self.batch = self.batch, []
+        size = -(-len(batch) // self.workers)
+        loop = asyncio.get_running_loop()
+        for start in range(0, len(batch), size):
+            chunk = batch[start:start + size]
+            task = loop.run_in_executor(self.executor, _solve_batch, [(loc, params) for loc, params, _ in chunk])
+            task.add_done_callback(lambda task, chunk=chunk: self._batch_done(chunk, task))
+            self.counters["batches"] += 1
+            self.counters["batched_requests"] += len(chunk)
+
+    @staticmethod
+    def _batch_done(chunk, task):
+        error = task.exception()
+        results = [(None, f"{type(error).__name__}: {error}")] * len(chunk) if error else task.result()
+        for (_, _, future), (result, message) in zip(chunk, results):
+            if future.done():
+                continue
+            if message is None:
+                future.set_result(result)
+            else:
+                future.set_exception(RuntimeError(message))
+
+    def stats(self):
+        return {
+            **self.counters,
+            "workers": self.workers,
+            "cache_hits": self.results.hits,
+            "cache_misses": self.results.misses,
+            "matrices": len(self.matrices.entries),
+            "matrix_builds": self.matrices.builds,
+            "matrix_mb": self.matrices.nbytes() / 2 ** 20,
+        }
+
+    # Read one HTTP/1.1 request and return the response status and JSON body
+    async def _respond(self, reader):
+        request_line = (await reader.readline()).decode("latin-1").split()
+        if len(request_line) != 3:
+            return 400, {"error": "Malformed request line"}
+        method, path, _ = request_line
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length") or 0)
+        if length > MAX_BODY_BYTES:
+            return 413, {"error": f"Request body larger than {MAX_BODY_BYTES} bytes"}
+        body = await reader.readexactly(length) if length else b""
+
+        if method == "GET" and path == "/health":
+            return 200, {"status": "ok"}
+        if method == "GET" and path == "/stats":
+            return 200, self.stats()
+        if method == "POST" and path == "/solve":
+            try:
+                locations, params = parse_request(json.loads(body or b"null"))
+            except ValueError as e:  # Includes JSONDecodeError
+                return 400, {"error": str(e)}
+            return 200, await self.solve(locations, params)
+        return 404, {"error": f"No route for {method} {path}"}
+
+    async def _handle(self, reader, writer):
+        try:
+            try:
+                status, payload = await self._respond(reader)
+            except Exception as e:
+                self.counters["errors"] += 1
+                status, payload = 500, {"error": f"{type(e).__name__}: {e}"}
+            body = json.dumps(payload).encode()
+            reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large"}.get(status, "Error")
+            writer.write(f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n"
+                         f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+        except ConnectionError:
+            pass  # The client went away
+        finally:
+            writer.close()
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        server = await asyncio.start_server(self._handle, host, port)
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                asyncio.get_running_loop().add_signal_handler(signum, server.close)
+            except (NotImplementedError, RuntimeError):  # Windows, or not the main thread
+                pass
+        print(f"Routing service listening on http://{host}:{port} with {self.workers} workers", file=sys.stderr)
+        async with server:
+            try:
+                await server.serve_forever()
+            except asyncio.CancelledError:
+                pass  # Closed by a signal; the caller shuts down the pool and frees the matrices
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
+        self.matrices.close()
+
+
+class RoutingClient:
+    """
+    Client for a running routing service, e.g. RoutingClient("http://127.0.0.1:8765").
+
+    Parameters:
+    url (str): Base URL of the service.
+    timeout (float, optional): Seconds to wait for a response; None waits for as long as the solve takes.
+    """
+
+    def __init__(self, url, timeout=None):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def _request(self, path, payload=None):
+        data = None if payload is None else json.dumps(payload).encode()
+        request = urllib.request.Request(self.url + path, data=data, headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            message = json.loads(e.read() or b"{}").get("error", e.reason)
+            raise (ValueError if e.code == 400 else RuntimeError)(message) from None
+
+    def solve(self, locations, algorithm="nearest_neighbor", num_vehicles=1, improve=True,
+              time_budget=DEFAULT_TIME_BUDGET, seed=None):
+        """
+        Routes a set of locations on the service; same arguments as solver.solve_locations.
+
+        Returns:
+        tuple: The result key and (per-vehicle routes, per-vehicle distances in km, km saved by local search,
+        whether the route is proven optimal).
+        """
+        result = self._request("/solve", {
+            "locations": np.asarray(locations, dtype=np.float64).tolist(),
+            "algorithm": algorithm,
+            "vehicles": num_vehicles,
+            "improve": improve,
+            "time_budget": time_budget,
+            "seed": seed,
+        })
+        return result["key"], (result["routes"], result["distances"], result["saved_km"], result["proven"])
+
+    def stats(self):
+        return self._request("/stats")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: one per CPU)")
+    parser.add_argument("--cache-size", type=int, default=RESULT_CACHE_SIZE, help="Solve results kept in memory")
+    parser.add_argument("--cache-dir", default=os.environ.get("ROUTE_CACHE_DIR"), help="Also keep solve results here")
+    parser.add_argument("--matrix-memory-mb", type=float, default=MATRIX_MEMORY_MB,
+                        help="Memory kept for shared distance matrices not in use")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    service = RoutingService(args.workers, args.cache_size, args.cache_dir, args.matrix_memory_mb)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+import numpy as np
+
+DEFAULT_MAXSIZE = 128
+
+
+# Stable hash of a location set plus solver parameters, used as the cache key
+def fingerprint(locations, **params):
+    locations = np.ascontiguousarray(locations, dtype=np.float64)
+    digest = hashlib.sha256()
+    digest.update(str(locations.shape).encode())
+    digest.update(locations.tobytes())
+    digest.update(repr(sorted(params.items())).encode())
+    return digest.hexdigest()
+
+
+class SolveCache:
+    """
+    Bounded LRU cache for solve results and distance matrices, safe to share
+    between Streamlit sessions (each runs in its own thread).
+
+    Parameters:
+    maxsize (int, optional): Number of entries kept in memory.
+    directory (str, optional): If given, entries are also pickled here and
+    survive restarts; memory misses fall back to this on-disk tier.
+    """
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE, directory=None):
+        self.maxsize = maxsize
+        self.directory = directory
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.pkl")
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+        if self.directory and os.path.exists(self._path(key)):
+            with open(self._path(key), "rb") as f:
+                value = pickle.load(f)
+            self._remember(key, value)
+            with self.lock:
+                self.hits += 1
+            return value
+        with self.lock:
+            self.misses += 1
+        return default
+
+    def put(self, key, value):
+        self._remember(key, value)
+        if self.directory:
+            # Write then rename, so readers never see a partial file
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self._path(key))
+
+    def _remember(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    # Cached value for key, computing and storing it with compute() on a miss
+    def get_or_compute(self, key, compute):
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = compute()
+            self.put(key, value)
+        return value
@@ -0,0 +1,104 @@
+import numpy as np
+from distance_matrix import distance_matrix
+from functions import nearest_neighbor, ant_colony_optimization, total_distance, MATRIX_MAX_STOPS
+from genetic import genetic_algorithm
+from local_search import improve_route, DEFAULT_TIME_BUDGET
+from fleet import solve_fleet
+from profiling import phase
+from space_filling import hilbert_tour, window_optimize
+from exact import solve_exact, EXACT_MAX_STOPS
+
+# Construction algorithms for single-vehicle routes
+ALGORITHMS = ("nearest_neighbor", "aco", "ga", "hilbert", "exact")
+
+# Largest single-vehicle route an algorithm is run on (no limit when absent). ACO and GA
+# hold dense n x n matrices, so they are not offered where the matrix would not fit.
+ALGORITHM_MAX_STOPS = {"aco": MATRIX_MAX_STOPS, "ga": MATRIX_MAX_STOPS, "exact": EXACT_MAX_STOPS}
+
+
+# Raise ValueError for an unknown algorithm or one that cannot route n stops
+def check_algorithm(algorithm, n):
+    if algorithm not in ALGORITHMS:
+        raise ValueError(f"Unknown algorithm {algorithm!r}, expected one of {ALGORITHMS}")
+    max_stops = ALGORITHM_MAX_STOPS.get(algorithm)
+    if max_stops is not None and n > max_stops:
+        raise ValueError(f"The {algorithm!r} algorithm routes at most {max_stops} stops, got {n}")
+
+
+# Whether routing n stops with the algorithm builds the full distance matrix. The spatial-index
+# nearest neighbor avoids it on large inputs; the Hilbert curve and its windows never need it.
+def needs_matrix(algorithm, n):
+    if algorithm == "hilbert":
+        return False
+    return algorithm != "nearest_neighbor" or n <= MATRIX_MAX_STOPS
+
+
+def solve_locations(locations, algorithm="nearest_neighbor", num_vehicles=1, improve=True,
+                    time_budget=DEFAULT_TIME_BUDGET, dist_matrix=None, seed=None, workers=None, warm_start=None):
+    """
+    Routes a set of locations; shared by the app and the headless batch solver.
+
+    The "exact" algorithm solves routes of up to EXACT_MAX_STOPS stops optimally:
+    Held-Karp for the smallest, otherwise branch and bound within time_budget,
+    starting from the improved nearest neighbor route.
+
+    Parameters:
+    locations (array-like): An (n, 2) array of [latitude, longitude] coordinates; stop 0 is the depot.
+    algorithm (str, optional): One of ALGORITHMS, used when there is a single vehicle.
+    num_vehicles (int, optional): More than one splits the stops with solve_fleet.
+    improve (bool, optional): Apply 2-opt / Or-opt local search after construction.
+    time_budget (float, optional): Time budget in seconds of ACO or GA construction, of local search
+    and of branch and bound for "exact".
+    dist_matrix (numpy array, optional): Precomputed distance matrix; built when needed otherwise.
+    seed (int, optional): Seed for the randomized algorithms.
+    workers (int, optional): Process pool size for fleet and Hilbert window solves (1 solves in-process).
+    warm_start (WarmStart, optional): Seeds a single-vehicle solve from the previous solve of the same
+    stops (route, pheromones or elite chromosomes) and saves this solve's state for the next one.
+
+    Returns:
+    tuple: Per-vehicle routes, per-vehicle distances in km, the km saved by local search and whether
+    the route is proven optimal (only ever True for "exact", which may run out of time_budget first).
+    """
+    locations = np.asarray(locations, dtype=np.float64)
+    check_algorithm(algorithm, len(locations) if num_vehicles == 1 else 0)
+    saved_km = 0.0
+    if num_vehicles > 1:
+        with phase("fleet"):
+            routes, route_distances = solve_fleet(locations, num_vehicles, improve=improve, time_budget=time_budget,
+                                                  workers=workers, seed=seed)
+        return routes, route_distances, saved_km, False
+
+    if dist_matrix is None and needs_matrix(algorithm, len(locations)):
+        with phase("matrix"):
+            dist_matrix = distance_matrix(locations)
+    pheromones = elite = warm_route = None
+    with phase("construction"):
+        if warm_start is not None:
+            warm_route = warm_start.route(dist_matrix)
+        if algorithm == "aco":
+            pheromones = None if warm_start is None else warm_start.pheromones()
+            route, _ = ant_colony_optimization(dist_matrix, seed=seed, time_budget=time_budget, pheromones=pheromones)
+        elif algorithm == "ga":
+            elite = None if warm_start is None else warm_start.elite(dist_matrix)
+            route, _, _ = genetic_algorithm(dist_matrix, seed=seed, time_budget=time_budget, elite=elite)
+        elif warm_route is not None:
+            route = warm_route  # Yesterday's route beats any fresh nearest neighbor or Hilbert tour
+        elif algorithm == "hilbert":
+            route = hilbert_tour(locations)
+        else:
+            route, _ = nearest_neighbor(locations, dist_matrix)
+        if warm_route is not None and route is not warm_route and (total_distance(warm_route, locations, dist_matrix)
+                                       < total_distance(route, locations, dist_matrix)):
+            route = warm_route
+    if improve:
+        with phase("improvement"):
+            if algorithm == "hilbert":
+                route, saved_km = window_optimize(route, locations, time_budget=time_budget, workers=workers)
+            else:
+                route, saved_km = improve_route(route, locations, dist_matrix, time_budget=time_budget)
+    proven = False
+    if algorithm == "exact":
+        route, _, proven = solve_exact(dist_matrix, route, time_budget)
+    if warm_start is not None:
+        warm_start.save(route, pheromones, elite)
+    return [route], [total_distance(route, locations, dist_matrix)], saved_km, proven
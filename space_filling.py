@@ -0,0 +1,182 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from functions import total_distance
+from local_search import improve_path, DEFAULT_TIME_BUDGET
+from profiling import phase
+
+HILBERT_ORDER = 16  # Grid of 2**16 x 2**16 cells over the bounding box of the stops
+WINDOW_SIZE = 400  # Stops per window re-optimized by window_optimize
+WINDOW_CHUNKS = 8  # Windows sent to a pool worker per task
+
+
+# Position of every point along a Hilbert curve over a 2**order grid (x, y: integer arrays)
+def hilbert_index(x, y, order=HILBERT_ORDER):
+    x = np.asarray(x, dtype=np.uint64).copy()
+    y = np.asarray(y, dtype=np.uint64).copy()
+    last = np.uint64((1 << order) - 1)
+    d = np.zeros(len(x), dtype=np.uint64)
+    s = 1 << (order - 1)
+    while s > 0:
+        rx = (x & np.uint64(s)) > 0
+        ry = (y & np.uint64(s)) > 0
+        d += np.uint64(s) * np.uint64(s) * ((3 * rx.astype(np.uint64)) ^ ry.astype(np.uint64))
+        # Rotate the quadrant so the curve continues in the right orientation
+        flip = rx & ~ry
+        x[flip] ^= last
+        y[flip] ^= last
+        swap = ~ry
+        x[swap], y[swap] = y[swap], x[swap]
+        s >>= 1
+    return d
+
+
+def hilbert_tour(locations, start=0, order=HILBERT_ORDER):
+    """
+    Builds a tour by visiting the stops in Hilbert-curve order, in O(n log n) time and O(n) memory.
+
+    Longitudes are scaled by the cosine of the mean latitude so that grid cells are
+    roughly square on the ground. The tour is usually within 25-40% of a good one and
+    is meant as a fast, feasible start for window_optimize.
+
+    Parameters:
+    locations (array-like): An (n, 2) array of [latitude, longitude] coordinates.
+    start (int, optional): The stop the closed route starts and ends at (the depot).
+    order (int, optional): Bits of grid resolution per axis.
+
+    Returns:
+    list: Closed route, e.g. [0, 3, 1, 2, 0].
+    """
+    locations = np.asarray(locations, dtype=np.float64).reshape(-1, 2)
+    n = len(locations)
+    if n == 0:
+        return [start, start]
+    y = locations[:, 0]
+    x = locations[:, 1] * np.cos(np.radians(y.mean()))
+    scale = max(np.ptp(x), np.ptp(y)) or 1.0
+    cells = (1 << order) - 1
+    index = hilbert_index((x - x.min()) / scale * cells, (y - y.min()) / scale * cells, order)
+    tour = np.argsort(index, kind="stable")
+    tour = np.roll(tour, -int(np.flatnonzero(tour == start)[0]))
+    return tour.tolist() + [start]
+
+
+# Improve a batch of windows (each an open path of coordinates); runs in a pool worker.
+# Windows reached after the deadline (a time.monotonic() value, shared by all processes) stay unchanged.
+def _improve_windows(windows, time_budget, deadline=None):
+    results = []
+    for points in windows:
+        budget = time_budget
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                results.append(np.arange(len(points)))
+                continue
+            budget = remaining if budget is None else min(budget, remaining)
+        order = improve_path(list(range(len(points))), points, time_budget=budget)
+        results.append(np.asarray(order, dtype=np.intp))
+    return results
+
+
+def window_rounds(route, locations, window=WINDOW_SIZE, workers=None, window_time_budget=None, deadline=None):
+    """
+    Re-optimizes a tour window by window, yielding the tour after every round.
+
+    Each round cuts the tour into consecutive windows of `window` stops whose
+    endpoints stay fixed, improves every window independently (in parallel on a
+    ProcessPoolExecutor unless workers=1) and concatenates the results. Rounds
+    alternate between two window offsets half a window apart, so the windows of
+    one round overlap the boundaries of the previous one. Only the windows are
+    ever held as matrices, so memory stays linear in the number of stops.
+
+    With a deadline, every window of a round gets an equal share of the time left
+    and windows not reached before the deadline are kept as they are.
+
+    Parameters:
+    route (list): Closed route, e.g. from hilbert_tour.
+    locations (array-like): An (n, 2) array of [latitude, longitude] coordinates.
+    window (int, optional): Stops per window.
+    workers (int, optional): Pool size; None uses one process per CPU, 1 runs in-process.
+    window_time_budget (float, optional): Local search seconds per window; None runs to a local optimum.
+    deadline (float, optional): time.monotonic() value after which no window is improved.
+
+    Yields:
+    list: The closed route after each round.
+    """
+    locations = np.asarray(locations, dtype=np.float64)
+    tour = np.asarray(route, dtype=np.intp)
+    window = max(window, 4)
+    executor = ProcessPoolExecutor(workers) if workers != 1 else None
+    parallel = 1 if executor is None else workers or os.cpu_count() or 1
+    try:
+        offset = 0
+        while True:
+            # Window boundaries; consecutive windows share their endpoint
+            cuts = np.unique(np.concatenate(([0], np.arange(offset, len(tour) - 1, window - 1), [len(tour) - 1])))
+            windows = [tour[a:b + 1] for a, b in zip(cuts[:-1], cuts[1:])]
+            points = [locations[w] for w in windows]
+            batches = [points[k:k + WINDOW_CHUNKS] for k in range(0, len(points), WINDOW_CHUNKS)]
+            budget = window_time_budget
+            if deadline is not None:
+                share = max(deadline - time.monotonic(), 0.0) * parallel / len(windows)
+                budget = share if budget is None else min(budget, share)
+            with phase("windows"):
+                if executor is None:
+                    results = [_improve_windows(batch, budget, deadline) for batch in batches]
+                else:
+                    n_batches = len(batches)
+                    results = executor.map(_improve_windows, batches, [budget] * n_batches, [deadline] * n_batches)
+                orders = [order for batch in results for order in batch]
+            pieces = [w[order][:-1] for w, order in zip(windows, orders)]
+            tour = np.concatenate(pieces + [tour[-1:]])
+            yield tour.tolist()
+            offset = (window - 1) // 2 if offset == 0 else 0
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+
+def window_optimize(route, locations, window=WINDOW_SIZE, time_budget=DEFAULT_TIME_BUDGET, max_rounds=None,
+                    workers=None, callback=None, stop=None):
+    """
+    Runs window_rounds until the time budget or max_rounds is used up or a round stops improving.
+
+    Parameters:
+    route (list): Closed route, e.g. from hilbert_tour.
+    locations (array-like): An (n, 2) array of [latitude, longitude] coordinates.
+    window (int, optional): Stops per window.
+    time_budget (float, optional): Seconds; a round running past it keeps its remaining windows unchanged.
+    max_rounds (int, optional): Stop after this many rounds.
+    workers (int, optional): Pool size; None uses one process per CPU, 1 runs in-process.
+    callback (callable, optional): Called as callback(route, distance) after every improving round.
+    stop (threading.Event, optional): Ends the optimization after the current round once set.
+
+    Returns:
+    tuple: The improved route and the distance saved in km.
+    """
+    deadline = None if time_budget is None else time.monotonic() + time_budget
+    best = list(route)
+    initial_distance = best_distance = total_distance(best, locations)
+    rounds = window_rounds(best, locations, window, workers, deadline=deadline)
+    stale = 0
+    try:
+        for k, tour in enumerate(rounds, 1):
+            distance = total_distance(tour, locations)
+            if distance < best_distance - 1e-9:
+                best, best_distance, stale = tour, distance, 0
+                if callback is not None:
+                    callback(best, best_distance)
+            else:
+                stale += 1
+                if stale == 2:
+                    break  # Neither window offset improves any more
+            if max_rounds is not None and k >= max_rounds:
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            if stop is not None and stop.is_set():
+                break
+    finally:
+        rounds.close()
+    return best, initial_distance - best_distance
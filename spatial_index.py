@@ -0,0 +1,220 @@
+import numpy as np
+
+DEFAULT_LEAF_SIZE = 32
+
+
+# Convert [latitude, longitude] pairs in degrees to 3D points on the unit sphere.
+# Straight-line (chord) distance between these points grows monotonically with
+# the great-circle distance, so nearest-by-chord is also nearest-by-haversine.
+def to_unit_sphere(locations):
+    locations = np.radians(np.asarray(locations, dtype=np.float64).reshape(-1, 2))
+    lat, lon = locations[:, 0], locations[:, 1]
+    return np.column_stack((np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)))
+
+
+class SphereKDTree:
+    """
+    k-d tree over unit-sphere coordinates that supports deleting points.
+
+    Every node keeps a count of its points that have not been removed yet, so
+    nearest() skips exhausted subtrees and stays roughly logarithmic as the
+    tree empties out during tour construction.
+
+    Parameters:
+    locations (array-like): An (n, 2) array of [latitude, longitude] coordinates.
+    leaf_size (int, optional): Maximum number of points stored in a leaf.
+    """
+
+    def __init__(self, locations, leaf_size=DEFAULT_LEAF_SIZE):
+        self.points = to_unit_sphere(locations)
+        n = len(self.points)
+        order = np.arange(n)
+
+        # Flat node storage; children of internal nodes are node ids, leaves have left == -1
+        self.lower, self.upper = [], []
+        self.left, self.right, self.parent = [], [], []
+        self.split_dim, self.split_value = [], []
+        self.count = []
+        self.leaf_points, self.leaf_ids, self.leaf_alive = [], [], []
+        self.point_leaf = np.empty(n, dtype=np.intp)
+        self.point_slot = np.empty(n, dtype=np.intp)
+
+        stack = [(0, n, -1, False)]
+        while stack:
+            start, end, parent, is_right = stack.pop()
+            node = len(self.left)
+            pts = self.points[order[start:end]]
+            self.lower.append(tuple(pts.min(axis=0)) if end > start else (np.inf,) * 3)
+            self.upper.append(tuple(pts.max(axis=0)) if end > start else (-np.inf,) * 3)
+            self.parent.append(parent)
+            self.count.append(end - start)
+            self.left.append(-1)
+            self.right.append(-1)
+            self.split_dim.append(0)
+            self.split_value.append(0.0)
+            self.leaf_points.append(None)
+            self.leaf_ids.append(None)
+            self.leaf_alive.append(None)
+            if parent >= 0:
+                if is_right:
+                    self.right[parent] = node
+                else:
+                    self.left[parent] = node
+
+            if end - start <= leaf_size:
+                ids = order[start:end].copy()
+                self.leaf_points[node] = self.points[ids]
+                self.leaf_ids[node] = ids
+                self.leaf_alive[node] = np.ones(len(ids), dtype=bool)
+                self.point_leaf[ids] = node
+                self.point_slot[ids] = np.arange(len(ids))
+                continue
+
+            # Split on the widest dimension at the median
+            dim = int(np.argmax(pts.max(axis=0) - pts.min(axis=0)))
+            mid = (end - start) // 2
+            part = np.argpartition(pts[:, dim], mid)
+            order[start:end] = order[start:end][part]
+            self.split_dim[node] = dim
+            self.split_value[node] = float(pts[part[mid], dim])
+            stack.append((start + mid, end, node, True))
+            stack.append((start, start + mid, node, False))
+
+    def __len__(self):
+        return self.count[0] if self.count else 0
+
+    # Mark a point as visited so it is never returned by nearest() again
+    def remove(self, index):
+        node = self.point_leaf[index]
+        slot = self.point_slot[index]
+        if not self.leaf_alive[node][slot]:
+            return
+        self.leaf_alive[node][slot] = False
+        while node >= 0:
+            self.count[node] -= 1
+            node = self.parent[node]
+
+    # Index of the closest point that has not been removed, or -1 if none are left
+    def nearest(self, index):
+        q = self.points[index]
+        qx, qy, qz = q
+        best, best_d = -1, np.inf
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            if not self.count[node]:
+                continue
+            lo, hi = self.lower[node], self.upper[node]
+            dx = lo[0] - qx if qx < lo[0] else (qx - hi[0] if qx > hi[0] else 0.0)
+            dy = lo[1] - qy if qy < lo[1] else (qy - hi[1] if qy > hi[1] else 0.0)
+            dz = lo[2] - qz if qz < lo[2] else (qz - hi[2] if qz > hi[2] else 0.0)
+            if dx * dx + dy * dy + dz * dz >= best_d:
+                continue
+
+            left = self.left[node]
+            if left < 0:
+                d = ((self.leaf_points[node] - q) ** 2).sum(axis=1)
+                d[~self.leaf_alive[node]] = np.inf
+                k = int(np.argmin(d))
+                if d[k] < best_d:
+                    best, best_d = int(self.leaf_ids[node][k]), d[k]
+                continue
+
+            # Push the farther child first so the nearer one is searched first
+            right = self.right[node]
+            if q[self.split_dim[node]] < self.split_value[node]:
+                stack.append(right)
+                stack.append(left)
+            else:
+                stack.append(left)
+                stack.append(right)
+        return best
+
+
+# Nearest Neighbor tour built on the spatial index instead of a distance matrix.
+# Memory stays linear in the number of stops, so it works for 100k+ stop batches.
+def nearest_neighbor_tour(locations, start=0, leaf_size=DEFAULT_LEAF_SIZE):
+    n = len(locations)
+    if n == 0:
+        return [start, start]
+    tree = SphereKDTree(locations, leaf_size)
+    route = [start]
+    tree.remove(start)
+    while len(tree):
+        nearest = tree.nearest(route[-1])
+        route.append(nearest)
+        tree.remove(nearest)
+    route.append(start)
+    return route
+
+
+# Merge the squared distances from query points q to candidate points into their running k best
+def _merge_nearest(best_d, best_i, q, q_ids, points, ids):
+    d = ((q[:, None, :] - points[None, :, :]) ** 2).sum(axis=2)
+    d[q_ids[:, None] == ids[None, :]] = np.inf  # A point is not its own neighbor
+    all_d = np.concatenate((best_d, d), axis=1)
+    all_i = np.concatenate((best_i, np.broadcast_to(ids, d.shape)), axis=1)
+    keep = np.argpartition(all_d, best_d.shape[1] - 1, axis=1)[:, :best_d.shape[1]]
+    return np.take_along_axis(all_d, keep, axis=1), np.take_along_axis(all_i, keep, axis=1)
+
+
+def k_nearest_neighbors(locations, k, leaf_size=DEFAULT_LEAF_SIZE):
+    """
+    The k nearest other locations of every location, nearest first, without a distance matrix.
+
+    Queries are answered a whole leaf of the SphereKDTree at a time: the tree is
+    walked once per leaf, nearest nodes first, skipping every node farther from
+    the leaf's bounding box than the current k-th neighbor of any of its points.
+    This takes about O(n log n) time and O(n k) memory.
+
+    Parameters:
+    locations (array-like): An (n, 2) array of [latitude, longitude] coordinates.
+    k (int): Neighbors per location (at most n - 1).
+    leaf_size (int, optional): Maximum number of points stored in a leaf.
+
+    Returns:
+    numpy array: An (n, k) array of location indices, as distance_matrix.nearest_neighbors returns.
+    """
+    tree = SphereKDTree(locations, leaf_size)
+    n = len(tree.points)
+    k = max(0, min(k, n - 1))
+    neighbors = np.empty((n, k), dtype=np.intp)
+    if k == 0:
+        return neighbors
+    leaves = [node for node in range(len(tree.left)) if tree.left[node] < 0 and len(tree.leaf_ids[node])]
+    for leaf in leaves:
+        q, q_ids = tree.leaf_points[leaf], tree.leaf_ids[leaf]
+        (lx, ly, lz), (hx, hy, hz) = tree.lower[leaf], tree.upper[leaf]
+        best_d = np.full((len(q_ids), k), np.inf)
+        best_i = np.full((len(q_ids), k), -1, dtype=np.intp)
+        best_d, best_i = _merge_nearest(best_d, best_i, q, q_ids, q, q_ids)
+        radius = best_d.max()  # Squared chord distance beyond which no point can improve any query
+        stack = [0]
+        while stack:
+            node = stack.pop()
+            if node == leaf:
+                continue
+            lo, hi = tree.lower[node], tree.upper[node]
+            dx = max(lo[0] - hx, lx - hi[0], 0.0)
+            dy = max(lo[1] - hy, ly - hi[1], 0.0)
+            dz = max(lo[2] - hz, lz - hi[2], 0.0)
+            if dx * dx + dy * dy + dz * dz > radius:
+                continue
+
+            left = tree.left[node]
+            if left < 0:
+                best_d, best_i = _merge_nearest(best_d, best_i, q, q_ids, tree.leaf_points[node], tree.leaf_ids[node])
+                radius = best_d.max()
+                continue
+
+            # Push the farther child first so the nearer one is searched first
+            right = tree.right[node]
+            if (lx + hx, ly + hy, lz + hz)[tree.split_dim[node]] / 2 < tree.split_value[node]:
+                stack.append(right)
+                stack.append(left)
+            else:
+                stack.append(left)
+                stack.append(right)
+        order = np.argsort(best_d, axis=1, kind="stable")
+        neighbors[q_ids] = np.take_along_axis(best_i, order, axis=1)
+    return neighbors
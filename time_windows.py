@@ -0,0 +1,187 @@
+import time
+from collections import namedtuple
+import numpy as np
+
+EPSILON = 1e-9  # Time warp below this is treated as rounding noise
+
+# Summary of a partial route used for O(1) feasibility checks (Savelsbergh / Vidal style):
+# travel cost, minimum duration (travel + service + waiting), earliest and latest feasible
+# start at its first stop, and time warp (> 0 means some window is missed)
+Segment = namedtuple("Segment", "first last cost duration earliest latest time_warp")
+
+# Result of simulating a route: per-stop arrival, service start, waiting and slack
+# (how much later service could start without breaking a later window)
+Schedule = namedtuple("Schedule", "arrival begin wait slack feasible")
+
+
+# Segment for a single stop
+def node_segment(stop, windows, service_times):
+    return Segment(stop, stop, 0.0, service_times[stop], windows[stop][0], windows[stop][1], 0.0)
+
+
+# Summary of segment a followed by segment b, where travel is the time from a.last to b.first
+def concat(a, b, travel):
+    delta = a.duration - a.time_warp + travel
+    wait = max(b.earliest - delta - a.latest, 0.0)
+    warp = max(a.earliest + delta - b.latest, 0.0)
+    return Segment(a.first, b.last, a.cost + travel + b.cost,
+                   a.duration + b.duration + travel + wait,
+                   max(b.earliest - delta, a.earliest) - wait,
+                   min(b.latest - delta, a.latest) + warp,
+                   a.time_warp + b.time_warp + warp)
+
+
+# Travel times in minutes from a distance matrix in km and an average speed in km/h
+def travel_time_matrix(dist_matrix, speed):
+    return np.asarray(dist_matrix, dtype=np.float64) / speed * 60
+
+
+def schedule(route, travel_times, windows, service_times=None, start_time=None):
+    """
+    Simulates a route in O(n): arrival and service start at each stop, waiting
+    for windows to open, and the slack before each stop's service start becomes
+    too late for the rest of the route.
+
+    Parameters:
+    route (list): Stop indices in visiting order, e.g. [0, 3, 1, 2, 0].
+    travel_times (numpy array): Travel time matrix, in the same unit as the windows.
+    windows (array-like): [earliest, latest] service start for every stop.
+    service_times (array-like, optional): Time spent at each stop (defaults to 0).
+    start_time (float, optional): Departure time from the first stop (defaults to its window opening).
+
+    Returns:
+    Schedule: Per-stop arrival, begin, wait and slack arrays, and whether every window is met.
+    """
+    windows = np.asarray(windows, dtype=np.float64)
+    service = np.zeros(len(windows)) if service_times is None else np.asarray(service_times, dtype=np.float64)
+    route = np.asarray(route, dtype=np.intp)
+    legs = np.asarray(travel_times)[route[:-1], route[1:]].astype(np.float64)
+
+    arrival = np.empty(len(route))
+    begin = np.empty(len(route))
+    current = windows[route[0], 0] if start_time is None else start_time
+    for k, stop in enumerate(route):
+        if k:
+            current = begin[k - 1] + service[route[k - 1]] + legs[k - 1]
+        arrival[k] = current
+        begin[k] = max(current, windows[stop, 0])
+
+    # Latest service start at each stop that still lets every later stop meet its window
+    latest = np.empty(len(route))
+    latest[-1] = windows[route[-1], 1]
+    for k in range(len(route) - 2, -1, -1):
+        latest[k] = min(windows[route[k], 1], latest[k + 1] - service[route[k]] - legs[k])
+    slack = latest - begin
+    return Schedule(arrival, begin, begin - arrival, slack, bool((slack >= -EPSILON).all()))
+
+
+class TimeWindowRoute:
+    """
+    A route with precomputed forward (prefix) and backward (suffix) segment summaries,
+    so that inserting a stop or reversing a section can be checked for time-window
+    feasibility in O(1) instead of re-simulating the route.
+
+    Parameters:
+    route (list): Stop indices in visiting order, starting and ending at the depot.
+    travel_times (numpy array): Travel time matrix (may be asymmetric).
+    windows (array-like): [earliest, latest] service start for every stop.
+    service_times (array-like, optional): Time spent at each stop (defaults to 0).
+    """
+
+    def __init__(self, route, travel_times, windows, service_times=None):
+        self.route = [int(c) for c in route]
+        self.travel = np.asarray(travel_times)
+        self.windows = np.asarray(windows, dtype=np.float64).tolist()
+        self.service = [0.0] * len(self.windows) if service_times is None else [float(s) for s in service_times]
+        self.update()
+
+    def t(self, i, j):
+        return self.travel.item(i, j)
+
+    def node(self, stop):
+        return node_segment(stop, self.windows, self.service)
+
+    # Recompute the prefix/suffix summaries after the route changed, in O(n)
+    def update(self):
+        route = self.route
+        self.forward = [self.node(route[0])]
+        for k in range(1, len(route)):
+            self.forward.append(concat(self.forward[-1], self.node(route[k]), self.t(route[k - 1], route[k])))
+        self.backward = [self.node(route[-1])]
+        for k in range(len(route) - 2, -1, -1):
+            self.backward.append(concat(self.node(route[k]), self.backward[-1], self.t(route[k], route[k + 1])))
+        self.backward.reverse()
+        self._reversed = {}
+
+    @property
+    def feasible(self):
+        return self.forward[-1].time_warp <= EPSILON
+
+    @property
+    def cost(self):
+        return self.forward[-1].cost
+
+    # Feasibility and added travel cost of inserting stop u between positions k and k + 1
+    def insertion(self, u, k):
+        route = self.route
+        head = concat(self.forward[k], self.node(u), self.t(route[k], u))
+        whole = concat(head, self.backward[k + 1], self.t(u, route[k + 1]))
+        return whole.time_warp <= EPSILON, whole.cost - self.cost
+
+    # Summary of positions i..j visited in reverse, extended one stop at a time and cached,
+    # so scanning j upwards for a fixed i costs O(1) per move
+    def reversed_segment(self, i, j):
+        segments = self._reversed.setdefault(i, [self.node(self.route[i])])
+        while len(segments) <= j - i:
+            k = i + len(segments)
+            segments.append(concat(self.node(self.route[k]), segments[-1], self.t(self.route[k], self.route[k - 1])))
+        return segments[j - i]
+
+    # Feasibility and cost change of reversing positions i..j (1 <= i < j <= len(route) - 2)
+    def two_opt(self, i, j):
+        route = self.route
+        head = concat(self.forward[i - 1], self.reversed_segment(i, j), self.t(route[i - 1], route[j]))
+        whole = concat(head, self.backward[j + 1], self.t(route[i], route[j + 1]))
+        return whole.time_warp <= EPSILON, whole.cost - self.cost
+
+
+# Time-window-aware cheapest insertion: stops are taken in order of closing time and
+# inserted at the cheapest position that keeps every window feasible
+def time_window_insertion(travel_times, windows, service_times=None, depot=0):
+    state = TimeWindowRoute([depot, depot], travel_times, windows, service_times)
+    stops = [c for c in range(len(state.windows)) if c != depot]
+    stops.sort(key=lambda c: (state.windows[c][1], state.windows[c][0]))
+    unserved = []
+    for u in stops:
+        best = None
+        for k in range(len(state.route) - 1):
+            feasible, added = state.insertion(u, k)
+            if feasible and (best is None or added < best[0]):
+                best = (added, k)
+        if best is None:
+            unserved.append(u)
+            continue
+        state.route.insert(best[1] + 1, u)
+        state.update()
+    return state.route, unserved
+
+
+# 2-opt restricted to moves that keep every window feasible (first improvement)
+def time_window_two_opt(route, travel_times, windows, service_times=None, time_budget=None):
+    start_time = time.perf_counter()
+    state = TimeWindowRoute(route, travel_times, windows, service_times)
+    initial_cost = state.cost
+    improved = True
+    while improved and (time_budget is None or time.perf_counter() - start_time < time_budget):
+        improved = False
+        for i in range(1, len(state.route) - 2):
+            for j in range(i + 1, len(state.route) - 1):
+                feasible, delta = state.two_opt(i, j)
+                if feasible and delta < -1e-9:
+                    state.route[i:j + 1] = state.route[i:j + 1][::-1]
+                    state.update()
+                    improved = True
+                    break
+            if improved:
+                break
+    return state.route, initial_cost - state.cost
@@ -0,0 +1,157 @@
+import os
+import tempfile
+import numpy as np
+from distance_matrix import haversine_pairs
+
+ELITE_SIZE = 10  # GA chromosomes kept between solves
+KEY_DECIMALS = 5  # Coordinates rounded to about a metre when stops are identified by position
+MIN_OVERLAP = 0.5  # Share of today's stops that must have been seen before for a warm start
+
+
+# One identity string per stop from its rounded coordinates, for manifests without stop IDs
+def stop_keys(locations, decimals=KEY_DECIMALS):
+    rounded = np.round(np.asarray(locations, dtype=np.float64).reshape(-1, 2), decimals) + 0.0  # No "-0.0"
+    return [f"{lat:.{decimals}f},{lon:.{decimals}f}" for lat, lon in rounded.tolist()]
+
+
+# Insert each stop at the cheapest position of a closed route, one at a time
+def insert_stops(route, stops, locations, dist_matrix=None):
+    route = list(route)
+    points = np.asarray(locations, dtype=np.float64)
+    for s in stops:
+        a, b = np.asarray(route[:-1]), np.asarray(route[1:])
+        if dist_matrix is not None:
+            cost = dist_matrix[a, s] + dist_matrix[s, b] - dist_matrix[a, b]
+        else:
+            lat, lon = points[:, 0], points[:, 1]
+            cost = (haversine_pairs(lat[a], lon[a], lat[s], lon[s]) + haversine_pairs(lat[s], lon[s], lat[b], lon[b])
+                    - haversine_pairs(lat[a], lon[a], lat[b], lon[b]))
+        k = int(np.argmin(cost))
+        route.insert(k + 1, int(s))
+    return route
+
+
+class WarmStart:
+    """
+    Solver state carried over between solves of a recurring manifest: the last
+    route, the ACO pheromone matrix and the GA elite chromosomes, stored in one
+    .npz file and keyed by stop identity rather than by position in the manifest.
+
+    Stops seen before are remapped to today's indices and new ones are inserted
+    where they are cheapest, so the next solve starts from yesterday's route
+    instead of from scratch. With too little overlap (MIN_OVERLAP) there is
+    nothing to seed from and the solve starts cold, but its state is still saved.
+
+    Parameters:
+    path (str): The .npz file the state is read from and saved to.
+    locations (array-like): Today's (n, 2) [latitude, longitude] coordinates; stop 0 is the depot.
+    keys (list, optional): Identity of every stop, e.g. address IDs; stop_keys(locations) when None.
+    """
+
+    def __init__(self, path, locations, keys=None):
+        self.path = path
+        self.locations = np.asarray(locations, dtype=np.float64).reshape(-1, 2)
+        self.keys = stop_keys(self.locations) if keys is None else [str(key) for key in keys]
+        if len(self.keys) != len(self.locations):
+            raise ValueError(f"Got {len(self.keys)} stop keys for {len(self.locations)} locations")
+        self.n = len(self.keys)
+        self.previous = None
+        self.old = np.full(self.n, -1, dtype=np.intp)  # Previous index of every stop, -1 for new stops
+        if os.path.exists(path):
+            with np.load(path, allow_pickle=False) as data:
+                self.previous = {name: data[name] for name in data.files}
+            index = {key: i for i, key in enumerate(self.previous["keys"].tolist())}
+            seen = set()
+            for i, key in enumerate(self.keys):
+                if key in index and key not in seen:  # A repeated key is a new stop from its second use on
+                    self.old[i] = index[key]
+                    seen.add(key)
+
+    # Number of today's stops that were in the previous solve
+    @property
+    def overlap(self):
+        return int((self.old >= 0).sum())
+
+    def usable(self):
+        return self.previous is not None and self.n > 0 and self.overlap >= MIN_OVERLAP * self.n
+
+    # Today's index of every previous stop, -1 for stops that are gone
+    def _new_index(self):
+        new = np.full(len(self.previous["keys"]), -1, dtype=np.intp)
+        kept = np.flatnonzero(self.old >= 0)
+        new[self.old[kept]] = kept
+        return new
+
+    # A previous cyclic order of stops in today's indices, gone stops dropped and new ones inserted
+    def _remap_cycle(self, order, dist_matrix=None):
+        cycle = self._new_index()[order]
+        cycle = cycle[cycle >= 0].tolist()
+        if 0 not in cycle:
+            cycle.insert(0, 0)  # The depot changed; it still starts the route
+        start = cycle.index(0)
+        route = cycle[start:] + cycle[:start] + [0]
+        missing = np.ones(self.n, dtype=bool)
+        missing[route] = False
+        return insert_stops(route, np.flatnonzero(missing), self.locations, dist_matrix)
+
+    def route(self, dist_matrix=None):
+        """
+        Yesterday's route in today's stop indices, or None when there is nothing usable to start from.
+
+        Parameters:
+        dist_matrix (numpy array, optional): Today's distance matrix; new stops are placed by haversine otherwise.
+
+        Returns:
+        list: Closed route starting and ending at the depot.
+        """
+        if not self.usable() or "route" not in self.previous:
+            return None
+        return self._remap_cycle(self.previous["route"][:-1], dist_matrix)
+
+    # Starting pheromone matrix for ant_colony_optimization: yesterday's trail between stops seen before,
+    # the mean trail to and from new stops; the uniform 1 / n of a cold start when there is nothing usable
+    def pheromones(self):
+        if not self.usable() or "pheromones" not in self.previous:
+            return np.ones((self.n, self.n)) / self.n
+        previous = self.previous["pheromones"]
+        pheromones = np.full((self.n, self.n), float(previous.mean()))
+        kept = np.flatnonzero(self.old >= 0)
+        pheromones[np.ix_(kept, kept)] = previous[np.ix_(self.old[kept], self.old[kept])]
+        return pheromones
+
+    # Elite chromosomes for genetic_algorithm in today's indices; rows of -1 are not seeded
+    def elite(self, dist_matrix=None):
+        elite = np.full((ELITE_SIZE, self.n), -1, dtype=np.intp)
+        if self.usable() and "elite" in self.previous:
+            rows = [row for row in self.previous["elite"] if (row >= 0).all()]
+            for i, row in enumerate(rows[:ELITE_SIZE]):
+                elite[i] = self._remap_cycle(row, dist_matrix)[:-1]
+        return elite
+
+    def save(self, route, pheromones=None, elite=None):
+        """
+        Stores this solve's state for the next one. Components this solve did not
+        produce are carried over from the previous state, remapped to today's stops.
+
+        Parameters:
+        route (list): The final closed route.
+        pheromones (numpy array, optional): The final ACO pheromone matrix.
+        elite (numpy array, optional): The final GA elite chromosomes.
+        """
+        if pheromones is None and self.usable() and "pheromones" in self.previous:
+            pheromones = self.pheromones()
+        if elite is None and self.usable() and "elite" in self.previous:
+            elite = self.elite()
+        state = {"keys": np.array(self.keys), "route": np.asarray(route, dtype=np.int32)}
+        if pheromones is not None:
+            state["pheromones"] = np.asarray(pheromones, dtype=np.float32)  # Half the size; trails need no more
+        if elite is not None and (np.asarray(elite) >= 0).all(axis=1).any():
+            state["elite"] = np.asarray(elite, dtype=np.int32)
+
+        # Write then rename, so a crash never leaves a partial state behind
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, **state)
+        os.replace(tmp, self.path)